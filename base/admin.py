@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import StudentProfile, Quiz, Submission, Courses, StudentComplaints
+from .models import StudentProfile, Quiz, Submission, Courses, StudentComplaints, StudentRanking, Job, LoginDevice
 
 admin.site.register(StudentProfile)
 admin.site.register(Quiz)
 admin.site.register(Submission)
 admin.site.register(Courses)
-admin.site.register(StudentComplaints)
\ No newline at end of file
+admin.site.register(StudentComplaints)
+admin.site.register(StudentRanking)
+admin.site.register(Job)
+admin.site.register(LoginDevice)
@@ -0,0 +1,128 @@
+import hashlib
+from functools import wraps
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+from .models import Courses, Quiz, Submission, StudentRanking
+from .services import get_user_rank
+
+# Read-only JSON API for polling clients, mounted under /api/v1/. Every
+# response carries a weak ETag built from the row count and the newest
+# `updated` timestamp of the rows behind it: one aggregate query over an
+# index. A client that sends it back in If-None-Match gets a 304 without
+# the listing being queried or serialized. The count catches deletions,
+# which leave the newest timestamp alone.
+API_VERSION = 'v1'
+
+
+def api_login_required(view):
+    # login_required would redirect an API client to the HTML login page
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+def collection_etag(queryset, *scope, timestamps=('updated',)):
+    # `timestamps` must cover every table the response reads from, e.g. a
+    # related row's `updated` when one of its fields is included
+    summary = queryset.order_by().aggregate(
+        count=Count('pk'), **{f'latest_{index}': Max(field) for index, field in enumerate(timestamps)},
+    )
+    latest = [isoformat(summary[f'latest_{index}']) or '' for index in range(len(timestamps))]
+    value = '|'.join([API_VERSION, *map(str, scope), str(summary['count']), *latest])
+    return f'W/"{hashlib.blake2b(value.encode(), digest_size=12).hexdigest()}"'
+
+def api_view(etag_func):
+    # GET/HEAD only, for signed-in users, answered with 304 when the ETag
+    # still matches. Responses are private and revalidated on every use.
+    def decorator(view):
+        view = condition(etag_func=etag_func)(view)
+        view = cache_control(private=True, no_cache=True)(view)
+        return api_login_required(require_safe(view))
+    return decorator
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def courses_etag(request):
+    return collection_etag(Courses.objects.all())
+
+@api_view(courses_etag)
+def courses(request):
+    rows = Courses.objects.order_by('id').values_list('id', 'course_no', 'course_title')
+    return JsonResponse({'courses': [
+        {'id': course_id, 'number': number, 'title': title}
+        for course_id, number, title in rows
+    ]})
+
+
+def quizzes_etag(request, course_id):
+    return collection_etag(Quiz.objects.filter(course_id=course_id), course_id)
+
+@api_view(quizzes_etag)
+def quizzes(request, course_id):
+    course = get_object_or_404(Courses.objects.only('id'), id=course_id)
+    rows = Quiz.objects.filter(course=course).order_by('due_date', 'id').values_list(
+        'id', 'quiz_no', 'quiz_title', 'description_excerpt', 'due_date', 'help_file', 'updated',
+    )
+    return JsonResponse({'course': course.id, 'quizzes': [
+        {
+            'id': quiz_id,
+            'number': number,
+            'title': title,
+            'excerpt': excerpt,
+            'due_date': isoformat(due_date),
+            'description_url': reverse('quiz_description', args=[quiz_id]),
+            'help_file_url': reverse('download_help_file', args=[quiz_id]) if help_file else None,
+            'updated': isoformat(updated),
+        }
+        for quiz_id, number, title, excerpt, due_date, help_file, updated in rows
+    ]})
+
+
+def submissions_etag(request):
+    # The body includes each quiz's title
+    return collection_etag(
+        Submission.objects.filter(student=request.user), request.user.id, timestamps=('updated', 'quiz__updated'),
+    )
+
+@api_view(submissions_etag)
+def submissions(request):
+    rows = Submission.objects.filter(student=request.user).order_by('-submitted_at', '-id').values_list(
+        'id', 'quiz_id', 'quiz__quiz_title', 'course_id', 'submitted_at', 'marks', 'updated',
+    )
+    return JsonResponse({'submissions': [
+        {
+            'id': submission_id,
+            'quiz': {'id': quiz_id, 'title': quiz_title},
+            'course': course_id,
+            'submitted_at': isoformat(submitted_at),
+            'marks': marks,
+            'file_url': reverse('download_submission', args=[submission_id]),
+            'updated': isoformat(updated),
+        }
+        for submission_id, quiz_id, quiz_title, course_id, submitted_at, marks, updated in rows
+    ]})
+
+
+def ranking_etag(request):
+    # Anyone's grading can move the user's rank, so the whole leaderboard
+    return collection_etag(StudentRanking.objects.all(), request.user.id)
+
+@api_view(ranking_etag)
+def ranking(request):
+    entry = get_user_rank(request.user)
+    if entry is None:
+        return JsonResponse({'ranking': None})
+    return JsonResponse({'ranking': {
+        'rank': entry.rank,
+        'total_marks': entry.total_marks,
+        'graded_count': entry.graded_count,
+        'updated': isoformat(entry.updated),
+    }})
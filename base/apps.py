@@ -3,4 +3,9 @@ from django.apps import AppConfig
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'base'
\ No newline at end of file
+    name = 'base'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Register the job queue's tasks
+        from . import notifications, services  # noqa: F401
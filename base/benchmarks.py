@@ -0,0 +1,242 @@
+import platform
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .caching import fragment_cache, invalidate
+from .models import Courses, Quiz, Submission, StudentProfile
+from .services import rebuild_rankings, render_description
+
+# Synthetic data and timings for the hot views, used by `manage.py seed_data`
+# and `manage.py benchmark`. Everything generated is prefixed with PREFIX so
+# it can be told apart from (and removed without touching) real rows.
+PREFIX = 'bench'
+DEFAULT_SIZES = {'students': 500, 'courses': 8, 'quizzes': 40, 'skew': 1.5}
+
+# name, URL name, who requests it, URL argument
+VIEWS = [
+    ('dashboard', 'dashboard', 'student', None),
+    ('courses', 'courses', 'student', None),
+    ('quizzes', 'quizzes', 'student', 'course'),
+    ('view_submissions', 'view_submissions', 'staff', 'course'),
+    ('view_quiz_submissions', 'view_quiz_submissions', 'staff', 'quiz'),
+    ('view_overall_rank', 'view_overall_rank', 'student', None),
+]
+
+
+def remove_data():
+    # Submissions, profiles and rankings go with their users and courses
+    User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+    Courses.objects.filter(course_no__startswith=f'{PREFIX.upper()}-').delete()
+
+@transaction.atomic
+def generate_data(students, courses, quizzes, skew, seed, password=None):
+    # Deterministic for a given seed. Student activity follows a Pareto
+    # distribution (`skew` is its shape, lower is more skewed): most students
+    # submit a few quizzes, a handful submit nearly all of them. Older
+    # quizzes collect more submissions than recent ones, and past-due ones
+    # are mostly graded.
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(password) if password else '!'
+
+    User.objects.bulk_create([User(username=f'{PREFIX}-staff', password=password, is_staff=True)])
+    User.objects.bulk_create([
+        User(username=f'{PREFIX}-{i:05d}', first_name=f'Student{i}', password=password)
+        for i in range(students)
+    ], batch_size=1000)
+    users = list(User.objects.filter(username__startswith=f'{PREFIX}-').order_by('username'))
+    StudentProfile.objects.bulk_create([StudentProfile(user=user, gender=rng.choice(['Male', 'Female'])) for user in users], batch_size=1000)
+    student_ids = [user.id for user in users if not user.is_staff]
+
+    Courses.objects.bulk_create([
+        Courses(course_title=f'Benchmark Course {i}', course_no=f'{PREFIX.upper()}-{i:03d}')
+        for i in range(courses)
+    ])
+    course_list = list(Courses.objects.filter(course_no__startswith=f'{PREFIX.upper()}-').order_by('course_no'))
+    Quiz.objects.bulk_create([
+        # bulk_create skips the pre_save signal that renders descriptions
+        render_description(Quiz(
+            quiz_title=f'Benchmark Quiz {i}', quiz_no=f'{PREFIX.upper()}-Q{i:04d}', description='<p>Benchmark quiz</p>',
+            course=course_list[i % courses],
+            # The first two thirds are closed, the rest still open
+            due_date=now + timedelta(days=i - quizzes * 2 // 3),
+        ))
+        for i in range(quizzes)
+    ])
+    quiz_list = list(Quiz.objects.filter(quiz_no__startswith=f'{PREFIX.upper()}-').order_by('quiz_no'))
+
+    activity = {student_id: min(rng.paretovariate(skew) / 4, 1.0) for student_id in student_ids}
+    submissions = []
+    for index, quiz in enumerate(quiz_list):
+        popularity = 1.0 - 0.6 * index / max(quizzes - 1, 1)
+        closed = quiz.due_date <= now
+        for student_id in student_ids:
+            if rng.random() >= min(activity[student_id] * popularity * 2, 1.0):
+                continue
+            graded = closed and rng.random() < 0.85
+            submissions.append(Submission(
+                student_id=student_id, course_id=quiz.course_id, quiz_id=quiz.id,
+                file=f'{PREFIX}/{quiz.quiz_no}-{student_id}.txt',
+                marks=round(rng.triangular(0, 10, 7)) if graded else None,
+            ))
+    Submission.objects.bulk_create(submissions, batch_size=1000)
+
+    # bulk_create sends no signals
+    rebuild_rankings()
+    invalidate('catalogue', *(f'user:{student_id}' for student_id in student_ids))
+    return {'users': len(users), 'courses': len(course_list), 'quizzes': len(quiz_list), 'submissions': len(submissions)}
+
+def benchmark_subjects():
+    # The most active student sees the fullest pages; the busiest quiz and
+    # its course the longest listings
+    student = User.objects.filter(username__startswith=f'{PREFIX}-', is_staff=False).annotate(
+        count=Count('submission'),
+    ).order_by('-count', 'id').first()
+    quiz = Quiz.objects.filter(quiz_no__startswith=f'{PREFIX.upper()}-').annotate(
+        count=Count('submission'),
+    ).order_by('-count', 'id').first()
+    if student is None or quiz is None:
+        raise LookupError('No benchmark data, run `manage.py seed_data` first')
+    return {
+        'student': student,
+        'staff': User.objects.get(username=f'{PREFIX}-staff'),
+        'quiz': quiz,
+        'course': quiz.course,
+    }
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+def logged_in_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+def fetch(client, url, cold):
+    # With `cold`, fragment caches are emptied first so the view does its
+    # full work on every request
+    if cold:
+        fragment_cache().clear()
+    started = time.perf_counter()
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+    return elapsed
+
+def benchmark_view(client, url, requests, threads, cold):
+    # Sequential pass: latency and query count
+    fetch(client, url, cold)
+    latencies = []
+    queries = []
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            latencies.append(fetch(client, url, cold))
+        queries.append(len(captured))
+
+    # Peak Python memory of one request
+    tracemalloc.start()
+    try:
+        fetch(client, url, cold)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Threaded pass: every thread has its own client and connection
+    threaded = []
+    failures = []
+
+    def worker(count):
+        thread_client = Client()
+        thread_client.cookies = client.cookies
+        try:
+            for _ in range(count):
+                threaded.append(fetch(thread_client, url, cold))
+        except Exception as e:
+            failures.append(e)
+        finally:
+            connections.close_all()
+
+    workers = [
+        threading.Thread(target=worker, args=[requests // threads + (index < requests % threads)])
+        for index in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - started
+    if failures:
+        raise failures[0]
+
+    return {
+        'queries': max(queries),
+        'p50_ms': milliseconds(statistics.median(latencies)),
+        'p95_ms': milliseconds(percentile(latencies, 0.95)),
+        'peak_kb': round(peak / 1024, 1),
+        'threaded': {
+            'threads': threads,
+            'p50_ms': milliseconds(statistics.median(threaded)),
+            'p95_ms': milliseconds(percentile(threaded, 0.95)),
+            'per_second': round(requests / wall, 1),
+        },
+    }
+
+def run_benchmarks(requests, threads, cold=True, views=None):
+    subjects = benchmark_subjects()
+    clients = {role: logged_in_client(subjects[role]) for role in ('student', 'staff')}
+    results = {}
+    for name, url_name, role, argument in VIEWS:
+        if views and name not in views:
+            continue
+        url = reverse(url_name, args=[subjects[argument].id] if argument else [])
+        results[name] = benchmark_view(clients[role], url, requests, threads, cold)
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+def compare(baseline, current, tolerance):
+    # Returns the regressions of `current` against `baseline`. More queries
+    # is always a regression; latency and memory get `tolerance` (0.25 =
+    # 25%) of slack because they vary between runs and machines.
+    regressions = []
+    for name, result in current['views'].items():
+        before = baseline.get('views', {}).get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries')
+        for label, key, value, old in [
+            ('p95', 'p95_ms', result['p95_ms'], before['p95_ms']),
+            ('threaded p95', 'p95_ms', result['threaded']['p95_ms'], before['threaded']['p95_ms']),
+            ('peak memory', 'peak_kb', result['peak_kb'], before['peak_kb']),
+        ]:
+            if value > old * (1 + tolerance):
+                unit = 'KB' if key == 'peak_kb' else 'ms'
+                regressions.append(f'{name}: {label} {old} -> {value} {unit}')
+    return regressions
@@ -0,0 +1,74 @@
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection, transaction
+
+# Rendered page fragments live in their own cache alias (settings.CACHES).
+# Each fragment's key includes the versions of the scopes its data comes
+# from, so a write only has to bump a version: stale fragments are never
+# looked up again and age out through the backend's LRU eviction.
+#
+# Scopes:
+#   catalogue        any Courses or Quiz row
+#   course:<id>      the quizzes of one course
+#   user:<id>        one user's submissions and profile
+#   rankings         the leaderboard
+FRAGMENT_CACHE = 'fragments'
+
+
+def fragment_cache():
+    return caches[FRAGMENT_CACHE]
+
+def version_key(scope):
+    return f'fragment-version:{scope}'
+
+def fresh_version():
+    # A version lost to eviction restarts from a new value rather than 0, so
+    # fragments rendered under an earlier run of the counter are not reused
+    return time.time_ns()
+
+def get_versions(*scopes):
+    cache = fragment_cache()
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, fresh_version(), timeout=None)
+        # Pick up the value of any request that initialised it first
+        versions.update(cache.get_many(missing))
+    return '.'.join(str(versions.get(key, 0)) for key in keys)
+
+def bump_versions(*scopes):
+    cache = fragment_cache()
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, fresh_version(), timeout=None)
+
+def invalidate(*scopes):
+    # Bump now, and again once the surrounding transaction commits: a request
+    # reading in between would otherwise cache the old rows under the new
+    # version.
+    bump_versions(*scopes)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(*scopes))
+
+def fragment_context(*scopes):
+    # Template context for `{% cache fragment_timeout name ... fragment_version using="fragments" %}`
+    return {
+        'fragment_version': get_versions(*scopes),
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+afragment_context = sync_to_async(fragment_context)
+
+async def afragment_cached(name, *vary_on):
+    # Whether `{% cache ... name *vary_on %}` will be a hit, so async views
+    # can skip their queries. Views still pass a lazy fallback in case the
+    # entry is evicted before the template renders.
+    return await fragment_cache().ahas_key(make_template_fragment_key(name, vary_on))
@@ -0,0 +1,72 @@
+import hashlib
+from functools import lru_cache
+from django.db.models import F
+from django.utils import timezone
+import httpagentparser
+from .models import LoginDevice
+
+# User agent parsing is a few dozen regular expressions in pure Python, and
+# a session's user agent does not change. The result is kept in the session
+# (checked against a hash of the header), and parses are shared between
+# sessions through a bounded LRU keyed by the user agent string.
+SESSION_KEY = '_device'
+UNKNOWN_DEVICE = 'Unknown Device'
+PARSE_CACHE_SIZE = 1024
+
+
+def user_agent_hash(user_agent):
+    return hashlib.blake2b(user_agent.encode(), digest_size=8).hexdigest()
+
+def _name(info, key):
+    part = info.get(key) or {}
+    name = part.get('name')
+    if name and part.get('version'):
+        return f"{name} {part['version']}"
+    return name or ''
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_user_agent(user_agent):
+    # Returns a small JSON-serialisable summary, safe to store in the session
+    info = httpagentparser.detect(user_agent)
+    return {
+        'platform': (info.get('platform') or {}).get('name') or UNKNOWN_DEVICE,
+        'os': _name(info, 'os'),
+        'browser': _name(info, 'browser'),
+        'bot': bool(info.get('bot')),
+    }
+
+def get_device(request):
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    ua_hash = user_agent_hash(user_agent)
+    session = getattr(request, 'session', None)
+    if session is not None:
+        stored = session.get(SESSION_KEY)
+        if stored and stored.get('hash') == ua_hash:
+            return stored['device']
+    device = parse_user_agent(user_agent)
+    if session is not None:
+        session[SESSION_KEY] = {'hash': ua_hash, 'device': device}
+    return device
+
+def record_login_device(user, request):
+    # Upsert the (user, user agent) row: one UPDATE for a known device
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    ua_hash = user_agent_hash(user_agent)
+    ip = request.META.get('REMOTE_ADDR') or None
+    updated = LoginDevice.objects.filter(user=user, user_agent_hash=ua_hash).update(
+        login_count=F('login_count') + 1, last_seen=timezone.now(), last_ip=ip,
+    )
+    if not updated:
+        device = parse_user_agent(user_agent)
+        LoginDevice.objects.update_or_create(
+            user=user, user_agent_hash=ua_hash,
+            defaults={'last_seen': timezone.now(), 'last_ip': ip},
+            create_defaults={
+                'platform': device['platform'][:50], 'browser': device['browser'][:50],
+                'last_seen': timezone.now(), 'last_ip': ip,
+            },
+        )
+
+def recent_login_devices(user, limit=5):
+    return LoginDevice.objects.filter(user=user).order_by('-last_seen')[:limit]
+
@@ -0,0 +1,132 @@
+import asyncio
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from django.utils._os import safe_join
+from django.utils.encoding import iri_to_uri
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+def not_modified(request, etag, mtime):
+    # If-None-Match wins over If-Modified-Since, as in RFC 9110
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+def parse_range(header, size):
+    # Single byte ranges only; anything else is served as the full file
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+async def aread_range(path, start, length):
+    # read_range() for ASGI: the blocking reads run in a worker thread, so
+    # the event loop keeps serving other requests during the transfer
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            block = await asyncio.to_thread(f.read, min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+def serve_file(request, name, download_name, as_attachment=True, reader=None):
+    # Serve a file from MEDIA_ROOT after the caller has checked permissions.
+    # With PROTECTED_MEDIA_SERVER set, the front-end server sends the bytes
+    # (nginx X-Accel-Redirect, Apache/lighttpd X-Sendfile); otherwise Python
+    # streams them with ETag, If-Modified-Since and Range support. `reader`
+    # replaces read_range() and FileResponse for the body, see aserve_file().
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not os.path.isfile(path):
+        raise Http404('File not found')
+    content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, download_name)
+
+    server = settings.PROTECTED_MEDIA_SERVER
+    if server == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = iri_to_uri(settings.PROTECTED_MEDIA_INTERNAL_URL + name)
+        response['Content-Disposition'] = disposition
+        return response
+    if server in ('apache', 'lighttpd'):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        response['Content-Disposition'] = disposition
+        return response
+
+    etag = file_etag(stat)
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (if_range is None or if_range == etag):
+        byte_range = parse_range(request.headers['Range'], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse((reader or read_range)(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+    elif reader:
+        response = StreamingHttpResponse(reader(path, 0, stat.st_size), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    response['Content-Disposition'] = disposition
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'private, max-age=0'
+    return response
+
+def aserve_file(request, name, download_name, as_attachment=True):
+    # serve_file() for async views. Under ASGI a synchronous file iterator is
+    # read into memory before it is sent, so the body is an async iterator.
+    return serve_file(request, name, download_name, as_attachment, reader=aread_range)
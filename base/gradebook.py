@@ -0,0 +1,149 @@
+import csv
+import io
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .models import Quiz, Submission
+from .notifications import enqueue_grade_notifications
+from .services import parse_marks, refresh_rankings
+
+# Gradebook CSV layout: one row per student, one column per quiz (by quiz_no)
+STUDENT_COLUMNS = ['Registration No', 'First Name', 'Last Name']
+TOTAL_COLUMN = 'Total'
+IMPORT_CHUNK_SIZE = 500
+ITERATOR_CHUNK_SIZE = 2000
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    # csv.writer only needs an object with write(); return the line so the
+    # generator below can yield it straight into the response.
+    def write(self, value):
+        return value
+
+
+def escape_cell(value):
+    # Text cells are written with a leading quote so a name like
+    # "=HYPERLINK(...)" is shown as text; numbers are left alone
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+def unescape_cell(value):
+    # Reverses escape_cell so an exported gradebook can be imported again
+    if value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+def gradebook_quizzes(course):
+    return list(Quiz.objects.filter(course=course).order_by('quiz_created_at', 'id').only('quiz_no'))
+
+def gradebook_rows(course):
+    # Merge two server-side cursors ordered by student id, the student list
+    # and the course's graded submissions, so only one student's marks are
+    # held in memory at a time.
+    quizzes = gradebook_quizzes(course)
+    columns = {quiz.id: index for index, quiz in enumerate(quizzes)}
+    writer = csv.writer(Echo())
+    yield writer.writerow(STUDENT_COLUMNS + [escape_cell(quiz.quiz_no) for quiz in quizzes] + [TOTAL_COLUMN])
+
+    students = User.objects.filter(is_staff=False, is_superuser=False).order_by('id').values_list(
+        'id', 'username', 'first_name', 'last_name',
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    marks = Submission.objects.filter(course=course, student__is_staff=False, student__is_superuser=False).order_by(
+        'student_id',
+    ).values_list('student_id', 'quiz_id', 'marks').iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+    pending = next(marks, None)
+    for student_id, username, first_name, last_name in students:
+        row = [''] * len(quizzes)
+        total = 0
+        while pending is not None and pending[0] <= student_id:
+            if pending[0] == student_id and pending[1] in columns and pending[2] is not None:
+                row[columns[pending[1]]] = pending[2]
+                total += pending[2]
+            pending = next(marks, None)
+        yield writer.writerow([escape_cell(value) for value in (username, first_name, last_name)] + row + [total])
+
+def import_gradebook(course, uploaded_file):
+    # Reads the CSV in chunks of IMPORT_CHUNK_SIZE rows. Each chunk costs a
+    # fixed number of queries: one user lookup, one submission lookup and a
+    # bulk_update. Blank cells are left untouched. The leaderboard is
+    # refreshed with each chunk, as bulk_grade() does; grade emails are left
+    # to the job worker. Returns (updated, errors).
+    reader = csv.reader(io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if not header or header[0].strip() != STUDENT_COLUMNS[0]:
+        return 0, [('header', f'First column must be "{STUDENT_COLUMNS[0]}"')]
+
+    quizzes = {quiz.quiz_no: quiz.id for quiz in gradebook_quizzes(course)}
+    quiz_columns = []
+    errors = []
+    for index, name in enumerate(header):
+        name = unescape_cell(name.strip())
+        if index < len(STUDENT_COLUMNS) or name == TOTAL_COLUMN or not name:
+            continue
+        if name in quizzes:
+            quiz_columns.append((index, quizzes[name]))
+        else:
+            errors.append(('header', f'Unknown quiz "{name}" ignored'))
+
+    updated = 0
+    line = 1
+    while True:
+        chunk = list(islice(reader, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        count, chunk_errors = _import_chunk(course, chunk, quiz_columns, line)
+        updated += count
+        errors += chunk_errors
+        line += len(chunk)
+    return updated, errors
+
+def _import_chunk(course, chunk, quiz_columns, first_line):
+    usernames = {unescape_cell(row[0].strip()) for row in chunk if row and row[0].strip()}
+    students = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    submissions = {
+        (submission.student_id, submission.quiz_id): submission
+        for submission in Submission.objects.filter(
+            course=course, student_id__in=students.values(), quiz_id__in=[quiz_id for _, quiz_id in quiz_columns],
+        ).only('student_id', 'quiz_id', 'marks')
+    }
+    errors = []
+    changed = []
+    now = timezone.now()
+    for offset, row in enumerate(chunk, start=1):
+        line = first_line + offset
+        if not row or not row[0].strip():
+            continue
+        username = unescape_cell(row[0].strip())
+        student_id = students.get(username)
+        if student_id is None:
+            errors.append((f'line {line}', f'Unknown student "{username}"'))
+            continue
+        for index, quiz_id in quiz_columns:
+            value = row[index].strip() if index < len(row) else ''
+            if not value:
+                continue
+            submission = submissions.get((student_id, quiz_id))
+            if submission is None:
+                errors.append((f'line {line}', f'{username} has no submission for column {index + 1}'))
+                continue
+            try:
+                marks = parse_marks(value)
+            except ValueError as e:
+                errors.append((f'line {line}', f'{username}: {e}'))
+                continue
+            if submission.marks != marks:
+                submission.marks = marks
+                submission.updated = now
+                changed.append(submission)
+
+    if changed:
+        with transaction.atomic():
+            Submission.objects.bulk_update(changed, ['marks', 'updated'], batch_size=500)
+            refresh_rankings(submission.student_id for submission in changed)
+            enqueue_grade_notifications([submission.id for submission in changed])
+    return len(changed), errors
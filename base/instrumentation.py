@@ -0,0 +1,158 @@
+import threading
+import time
+from contextvars import ContextVar
+from django.template.backends.django import DjangoTemplates
+
+# Per-request timings and per-view metrics. InstrumentationMiddleware opens
+# a RequestTiming for every request; the database wrapper and the template
+# backend below add to whichever timing is current. A context variable
+# rather than a thread local, so the ORM calls of async views, which run in
+# a worker thread, are still counted.
+#
+# Metrics are kept in memory per process: with several worker processes,
+# each one reports its own share of the requests.
+current_timing = ContextVar('current_timing', default=None)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        return (
+            f'app;dur={total * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f}'
+        )
+
+
+def time_query(execute, sql, params, many, context):
+    # Installed on every database connection, see install_query_timer()
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db_time += time.perf_counter() - started
+        timing.queries += 1
+
+def install_query_timer(connection):
+    # connection.execute_wrapper() only lasts for a `with` block in the
+    # current thread, so the wrapper is added to the connection for good and
+    # does nothing outside a request
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+        self.backend = template.backend
+
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # The Django template backend, with render time added to the request's
+    # timing. Includes and extends are part of their parent's render.
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, method, status, timing, total):
+        with self.lock:
+            metrics = self.views.setdefault(view, ViewMetrics())
+            key = (method, status)
+            metrics.requests[key] = metrics.requests.get(key, 0) + 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    metrics.buckets[index] += 1
+            metrics.count += 1
+            metrics.duration += total
+            metrics.queries += timing.queries
+            metrics.db_time += timing.db_time
+            metrics.template_time += timing.template_time
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP studybud_requests_total Requests handled, by view, method and status.',
+                '# TYPE studybud_requests_total counter',
+            ]
+            for view, view_metrics in views:
+                for (method, status), count in sorted(view_metrics.requests.items()):
+                    lines.append(f'studybud_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                '# HELP studybud_request_duration_seconds Time spent in the view and middleware.',
+                '# TYPE studybud_request_duration_seconds histogram',
+            ]
+            for view, view_metrics in views:
+                for bound, count in zip(DURATION_BUCKETS, view_metrics.buckets):
+                    lines.append(f'studybud_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'studybud_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {view_metrics.count}')
+                lines.append(f'studybud_request_duration_seconds_sum{{view="{view}"}} {view_metrics.duration:.6f}')
+                lines.append(f'studybud_request_duration_seconds_count{{view="{view}"}} {view_metrics.count}')
+            for name, help_text, attribute in [
+                ('db_queries_total', 'Database queries issued.', 'queries'),
+                ('db_duration_seconds_total', 'Time spent in database queries.', 'db_time'),
+                ('template_duration_seconds_total', 'Time spent rendering templates.', 'template_time'),
+            ]:
+                lines += [f'# HELP studybud_{name} {help_text}', f'# TYPE studybud_{name} counter']
+                for view, view_metrics in views:
+                    value = getattr(view_metrics, attribute)
+                    lines.append(f'studybud_{name}{{view="{view}"}} {value if attribute == "queries" else f"{value:.6f}"}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
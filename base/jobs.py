@@ -0,0 +1,150 @@
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+
+# A small database-backed job queue. Requests call enqueue() for work that
+# does not have to finish before the response (emails, leaderboard
+# recomputation, ...); `manage.py run_jobs` runs it. The job row is written
+# in the caller's transaction, so a job is only ever seen for data that
+# actually committed. Task functions are registered with @task (see
+# base.notifications) and receive the job payload as keyword arguments.
+TASKS = {}
+# Seconds between housekeeping runs in one process
+HOUSEKEEPING_INTERVAL = 60
+last_housekeeping = None
+
+
+class TaskDef:
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+    def enqueue(self, delay=None, **payload):
+        return enqueue(self.name, delay=delay, max_attempts=self.max_attempts, **payload)
+
+
+def task(func=None, *, name=None, max_attempts=3):
+    def register(func):
+        definition = TaskDef(func, name or f'{func.__module__}.{func.__name__}', max_attempts)
+        TASKS[definition.name] = definition
+        return definition
+    return register(func) if func is not None else register
+
+def enqueue(task_name, delay=None, max_attempts=3, **payload):
+    # The payload is stored as JSON, so pass ids rather than model instances
+    job = Job.objects.create(
+        task=task_name, payload=payload, max_attempts=max_attempts,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+    if settings.JOBS_RUN_INLINE and not delay:
+        # No worker (development, tests): run once the caller has committed
+        transaction.on_commit(lambda: run_claimed(job.id, 'inline'))
+    return job
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def claim_job(worker, job_id=None):
+    # Take the oldest due job. The conditional update makes the claim
+    # exclusive: when two workers race for a row only one UPDATE matches.
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=timezone.now())
+    if job_id is not None:
+        due = due.filter(id=job_id)
+    for candidate in due.order_by('run_after', 'id').values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(id=candidate, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, worker=worker, updated=timezone.now(),
+        )
+        if claimed:
+            return Job.objects.get(id=candidate)
+    return None
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+def run_job(job):
+    # The task runs in its own transaction: a failed attempt leaves nothing
+    # behind and is retried with exponential backoff until max_attempts.
+    definition = TASKS.get(job.task)
+    try:
+        if definition is None:
+            raise LookupError(f'Unknown task "{job.task}"')
+        with transaction.atomic():
+            definition(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts and definition is not None:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = Job.FAILED
+        job.save(update_fields=['status', 'run_after', 'last_error', 'updated'])
+        return False
+    job.status = Job.DONE
+    job.last_error = ''
+    job.save(update_fields=['status', 'last_error', 'updated'])
+    return True
+
+def run_claimed(job_id, worker):
+    job = claim_job(worker, job_id=job_id)
+    if job is not None:
+        run_job(job)
+    # Inline jobs have no worker loop to clean up after them
+    housekeeping()
+
+def run_pending_jobs(worker=None, limit=None):
+    # Run due jobs until the queue is empty; returns how many ran
+    worker = worker or worker_name()
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job(worker)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+def requeue_stale_jobs():
+    # Jobs whose worker died mid-run go back to the queue, or fail once
+    # they have used up their attempts
+    stale = Job.objects.filter(
+        status=Job.RUNNING, updated__lt=timezone.now() - timedelta(seconds=settings.JOBS_TIMEOUT),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, last_error='Worker stopped before the job finished', updated=timezone.now(),
+    )
+    return failed + stale.update(status=Job.QUEUED, updated=timezone.now())
+
+def purge_finished_jobs(max_age=None):
+    max_age = max_age or timedelta(days=settings.JOBS_KEEP_DAYS)
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated__lt=timezone.now() - max_age).delete()
+    return deleted
+
+def housekeeping(force=False):
+    # Requeue the jobs of dead workers and purge old finished ones, at most
+    # once every HOUSEKEEPING_INTERVAL seconds unless forced
+    global last_housekeeping
+    now = time.monotonic()
+    if not force and last_housekeeping is not None and now - last_housekeeping < HOUSEKEEPING_INTERVAL:
+        return
+    last_housekeeping = now
+    requeue_stale_jobs()
+    purge_finished_jobs()
+
+def run_worker(worker=None, poll_interval=1.0, stop=None):
+    # Poll until `stop()` returns true
+    worker = worker or worker_name()
+    while not (stop and stop()):
+        housekeeping()
+        if not run_pending_jobs(worker):
+            time.sleep(poll_interval)
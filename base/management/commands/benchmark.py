@@ -0,0 +1,73 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from base.benchmarks import DEFAULT_SIZES, VIEWS, compare, environment, generate_data, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot views against freshly seeded data in a throwaway test database, and write the '
+        'results as JSON. With --baseline, fail when a view got slower or issues more queries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=DEFAULT_SIZES['students'])
+        parser.add_argument('--courses', type=int, default=DEFAULT_SIZES['courses'])
+        parser.add_argument('--quizzes', type=int, default=DEFAULT_SIZES['quizzes'])
+        parser.add_argument('--skew', type=float, default=DEFAULT_SIZES['skew'])
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=50, help='Requests per view, in each pass')
+        parser.add_argument('--threads', type=int, default=8, help='Threads in the concurrent pass')
+        parser.add_argument('--warm', action='store_true', help='Keep fragment caches between requests')
+        parser.add_argument('--view', action='append', choices=[name for name, *_ in VIEWS], help='Only these views')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Earlier results to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed latency and memory growth, 0.25 = 25%%')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['threads'] < 1:
+            raise CommandError('--requests and --threads must be positive')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        data = {key: options[key] for key in ('students', 'courses', 'quizzes', 'skew', 'seed')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                counts = generate_data(**data)
+                views = run_benchmarks(options['requests'], options['threads'], cold=not options['warm'], views=options['view'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results = {
+            'environment': environment(),
+            'data': {**data, **counts},
+            'settings': {'requests': options['requests'], 'threads': options['threads'], 'warm': options['warm']},
+            'views': views,
+        }
+        self.stdout.write(
+            f'{"view":<24} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"peak KB":>8} '
+            f'{"thr p50":>8} {"thr p95":>8} {"req/s":>7}'
+        )
+        for name, result in views.items():
+            threaded = result['threaded']
+            self.stdout.write(
+                f'{name:<24} {result["queries"]:>7} {result["p50_ms"]:>8} {result["p95_ms"]:>8} {result["peak_kb"]:>8} '
+                f'{threaded["p50_ms"]:>8} {threaded["p95_ms"]:>8} {threaded["per_second"]:>7}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+
+        if baseline is not None:
+            if baseline.get('data') != results['data'] or baseline.get('settings') != results['settings']:
+                raise CommandError('The baseline was recorded with different data or settings')
+            regressions = compare(baseline, results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from base.uploads import clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked submission uploads that have not been touched for a day'
+
+    def handle(self, *args, **options):
+        count = clear_stale_uploads()
+        self.stdout.write(self.style.SUCCESS(f'{count} stale upload{"s" if count != 1 else ""} removed'))
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+import httpagentparser
+from base.devices import get_device, parse_user_agent
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+]
+
+
+def per_call_us(func, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+class Command(BaseCommand):
+    help = 'Time user agent detection per request: uncached, through the LRU and from the session'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations must be positive')
+
+        def uncached(i):
+            httpagentparser.detect(USER_AGENTS[i % len(USER_AGENTS)])
+
+        def lru(i):
+            parse_user_agent(USER_AGENTS[i % len(USER_AGENTS)])
+
+        # One request per user agent, each with a session that already holds
+        # the parsed device, as after the first page of a session
+        requests = []
+        for user_agent in USER_AGENTS:
+            request = RequestFactory().get('/', HTTP_USER_AGENT=user_agent)
+            request.session = {}
+            get_device(request)
+            requests.append(request)
+
+        def session(i):
+            get_device(requests[i % len(requests)])
+
+        self.stdout.write(f'{"method":<10} {"us/request":>10}')
+        for name, func in [('uncached', uncached), ('lru', lru), ('session', session)]:
+            self.stdout.write(f'{name:<10} {per_call_us(func, iterations):>10.2f}')
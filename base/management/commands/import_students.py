@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from base.registration import CREATE_CHUNK_SIZE, bulk_register, read_registration_csv
+
+
+class Command(BaseCommand):
+    help = 'Register students and staff in bulk from a CSV file (reg_no,password,first_name,last_name,gender,role)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=CREATE_CHUNK_SIZE, help='Users inserted per bulk_create')
+
+    def handle(self, *args, **options):
+        try:
+            csv_file = open(options['csv_file'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        with csv_file:
+            created, errors = bulk_register(
+                read_registration_csv(csv_file), workers=options['workers'], chunk_size=options['chunk_size'],
+            )
+        for line, error in errors:
+            self.stderr.write(f'line {line}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'{created} users registered, {len(errors)} rows skipped'))
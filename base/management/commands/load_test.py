@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+MODES = ['wsgi', 'asgi']
+
+
+def read_body(response):
+    if not response.streaming:
+        return len(response.content)
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+async def aread_body(response):
+    if not response.streaming:
+        return len(response.content)
+    content = response.streaming_content
+    if hasattr(content, '__aiter__'):
+        return sum([len(chunk) async for chunk in content])
+    return sum(len(chunk) for chunk in content)
+
+def summarize(mode, latencies, elapsed, statuses):
+    latencies = sorted(latencies)
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'per_second': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        'errors': sum(1 for status in statuses if status >= 400),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent throughput of a page under the sync WSGI handler and the ASGI handler '
+        '(with ASYNC_VIEWS). Each mode runs in its own process against the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='URL path to request, e.g. /download_submission/1/')
+        parser.add_argument('--username', required=True, help='User the requests are made as')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--mode', choices=MODES, help='Run a single mode in this process and print JSON')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['mode']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f'No user "{options["username"]}"')
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                run = self.run_wsgi if options['mode'] == 'wsgi' else self.run_asgi
+                result = run(user, options['path'], options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        # The URLconf picks sync or async views at import, so every mode
+        # needs a fresh process
+        results = []
+        for mode in MODES:
+            command = [
+                sys.executable, sys.argv[0], 'load_test', options['path'], '--username', options['username'],
+                '--requests', str(options['requests']), '--concurrency', str(options['concurrency']), '--mode', mode,
+            ]
+            env = {**os.environ, 'ASYNC_VIEWS': str(mode == 'asgi')}
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f'{"mode":<6} {"requests":>8} {"seconds":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"errors":>6}')
+        for result in results:
+            self.stdout.write(
+                f'{result["mode"]:<6} {result["requests"]:>8} {result["seconds"]:>8} {result["per_second"]:>8} '
+                f'{result["p50_ms"]:>8} {result["p95_ms"]:>8} {result["errors"]:>6}'
+            )
+
+    def run_wsgi(self, user, path, requests, concurrency):
+        login = Client()
+        login.force_login(user)
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.cookies = login.cookies
+            started = time.perf_counter()
+            response = local.client.get(path)
+            read_body(response)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - started
+        return summarize('wsgi', [latency for latency, _ in results], elapsed, [status for _, status in results])
+
+    def run_asgi(self, user, path, requests, concurrency):
+        login = Client()
+        login.force_login(user)
+
+        async def run():
+            client = AsyncClient()
+            client.cookies = login.cookies
+            limit = asyncio.Semaphore(concurrency)
+
+            async def fetch():
+                async with limit:
+                    started = time.perf_counter()
+                    response = await client.get(path)
+                    await aread_body(response)
+                    return time.perf_counter() - started, response.status_code
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(fetch() for _ in range(requests)))
+            return results, time.perf_counter() - started
+
+        results, elapsed = asyncio.run(run())
+        return summarize('asgi', [latency for latency, _ in results], elapsed, [status for _, status in results])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from base.services import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized leaderboard from graded submissions'
+
+    def handle(self, *args, **options):
+        rebuild_rankings()
+        self.stdout.write(self.style.SUCCESS('Rankings rebuilt'))
@@ -0,0 +1,50 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from base.jobs import housekeeping, run_pending_jobs, run_worker, worker_name
+
+
+def stop_on_signals(stopping):
+    # Finish the current job on SIGTERM/SIGINT, then exit
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopping.set())
+
+def work(poll_interval, stopping):
+    # Runs in a forked child
+    stop_on_signals(stopping)
+    run_worker(worker_name(), poll_interval=poll_interval, stop=stopping.is_set)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (emails, leaderboard refreshes) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due now, then exit')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        if options['once']:
+            # Also meant for cron when no worker runs, so it purges as well
+            housekeeping(force=True)
+            count = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f'{count} job{"s" if count != 1 else ""} run'))
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stopping = context.Event()
+        workers = [
+            context.Process(target=work, args=(options['poll_interval'], stopping))
+            for _ in range(options['processes'])
+        ]
+        for process in workers:
+            process.start()
+        stop_on_signals(stopping)
+        self.stdout.write(f'{len(workers)} worker{"s" if len(workers) != 1 else ""} started, press Ctrl+C to stop')
+        for process in workers:
+            process.join()
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from base.benchmarks import DEFAULT_SIZES, PREFIX, generate_data, remove_data
+from django.contrib.auth.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        f'Generate reproducible synthetic students, courses, quizzes and submissions (usernames "{PREFIX}-...") '
+        'for load tests and benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=DEFAULT_SIZES['students'])
+        parser.add_argument('--courses', type=int, default=DEFAULT_SIZES['courses'])
+        parser.add_argument('--quizzes', type=int, default=DEFAULT_SIZES['quizzes'])
+        parser.add_argument('--skew', type=float, default=DEFAULT_SIZES['skew'], help='Pareto shape of student activity, lower is more skewed')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--password', help='Password for the generated users; by default they cannot log in')
+        parser.add_argument('--replace', action='store_true', help='Remove earlier generated data first')
+
+    def handle(self, *args, **options):
+        if min(options['students'], options['courses'], options['quizzes']) < 1 or options['skew'] <= 0:
+            raise CommandError('--students, --courses, --quizzes and --skew must be positive')
+        if User.objects.filter(username__startswith=f'{PREFIX}-').exists():
+            if not options['replace']:
+                raise CommandError('Generated data already exists, pass --replace to regenerate it')
+            remove_data()
+        counts = generate_data(
+            options['students'], options['courses'], options['quizzes'], options['skew'], options['seed'],
+            password=options['password'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{counts["users"]} users, {counts["courses"]} courses, {counts["quizzes"]} quizzes '
+            f'and {counts["submissions"]} submissions created'
+        ))
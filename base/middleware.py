@@ -0,0 +1,70 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .devices import get_device
+from .instrumentation import RequestTiming, current_timing, metrics, view_label
+
+
+class DeviceMiddleware:
+    # Sets request.device, parsed on first use only. Must come after
+    # SessionMiddleware. Nothing here blocks, so it runs in async requests
+    # without a thread hop.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.device = SimpleLazyObject(lambda: get_device(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.device = SimpleLazyObject(lambda: get_device(request))
+        return await self.get_response(request)
+
+
+class InstrumentationMiddleware:
+    # Records wall time, query count, query time and template render time
+    # per view (see base.instrumentation) and, with SERVER_TIMING set, reports
+    # them in a Server-Timing header. Goes first in MIDDLEWARE so the other
+    # middleware is timed too. A streaming body is produced after the
+    # response is returned, so its transfer is not included.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.finish(request, response, timing)
+
+    def finish(self, request, response, timing):
+        total = timing.elapsed
+        metrics.record(view_label(request), request.method, response.status_code, timing, total)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timing.server_timing(total)
+        return response
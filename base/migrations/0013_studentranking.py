@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rankings(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Submission = apps.get_model('base', 'Submission')
+    StudentRanking = apps.get_model('base', 'StudentRanking')
+    totals = {
+        row['student_id']: row
+        for row in Submission.objects.filter(marks__isnull=False).values('student_id').annotate(
+            total_marks=Sum('marks'), graded_count=Count('id'),
+        ).order_by()
+    }
+    StudentRanking.objects.bulk_create([
+        StudentRanking(
+            user_id=user_id,
+            total_marks=totals.get(user_id, {}).get('total_marks', 0),
+            graded_count=totals.get(user_id, {}).get('graded_count', 0),
+        )
+        for user_id in User.objects.values_list('id', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_delete_pinattempttracker'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_marks', models.IntegerField(default=0)),
+                ('graded_count', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_marks', 'user'], name='ranking_order_idx')],
+            },
+        ),
+        migrations.RunPython(populate_rankings, migrations.RunPython.noop),
+    ]
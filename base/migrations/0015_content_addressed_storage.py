@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:48
+
+import base.models
+import base.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_files(apps, schema_editor):
+    # Files uploaded before this migration keep their names; register them so
+    # they are cleaned up like blobs once their last row is gone.
+    Submission = apps.get_model('base', 'Submission')
+    Quiz = apps.get_model('base', 'Quiz')
+    StoredBlob = apps.get_model('base', 'StoredBlob')
+    counts = {}
+    for model, field in [(Submission, 'file'), (Quiz, 'help_file')]:
+        rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values(field).annotate(
+            refs=Count('id'),
+        ).order_by()
+        for row in rows:
+            counts[row[field]] = counts.get(row[field], 0) + row['refs']
+    StoredBlob.objects.bulk_create([StoredBlob(name=name, ref_count=refs) for name, refs in counts.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='help_file',
+            field=models.FileField(blank=True, null=True, storage=base.storage.content_addressed_storage, upload_to='help_files/'),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='file',
+            field=models.FileField(storage=base.storage.content_addressed_storage, upload_to=base.models.student_directory_path),
+        ),
+        migrations.RunPython(count_existing_files, migrations.RunPython.noop),
+    ]
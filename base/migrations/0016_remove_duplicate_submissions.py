@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:58
+
+import base.storage
+from django.db import migrations, transaction
+from django.db.models import Count, F, Sum
+
+
+def remove_duplicate_submissions(apps, schema_editor):
+    # Keep the newest submission of each (student, quiz) pair. If it is not
+    # graded yet, it takes over the marks of the newest graded duplicate.
+    Submission = apps.get_model('base', 'Submission')
+    StoredBlob = apps.get_model('base', 'StoredBlob')
+    StudentRanking = apps.get_model('base', 'StudentRanking')
+    pairs = Submission.objects.values('student_id', 'quiz_id').annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    students = set()
+    for pair in pairs:
+        rows = list(Submission.objects.filter(student_id=pair['student_id'], quiz_id=pair['quiz_id']).order_by('-submitted_at', '-id'))
+        keep, duplicates = rows[0], rows[1:]
+        graded = next((row for row in duplicates if row.marks is not None), None)
+        if keep.marks is None and graded is not None:
+            keep.marks, keep.remarks = graded.marks, graded.remarks
+            keep.save(update_fields=['marks', 'remarks'])
+        for row in duplicates:
+            if row.file:
+                release_file(StoredBlob, row.file.name)
+        Submission.objects.filter(id__in=[row.id for row in duplicates]).delete()
+        students.add(pair['student_id'])
+
+    for student_id in students:
+        totals = Submission.objects.filter(student_id=student_id, marks__isnull=False).aggregate(
+            total_marks=Sum('marks'), graded_count=Count('id'),
+        )
+        StudentRanking.objects.filter(user_id=student_id).update(
+            total_marks=totals['total_marks'] or 0, graded_count=totals['graded_count'],
+        )
+
+def release_file(StoredBlob, name):
+    blob = StoredBlob.objects.filter(name=name).first()
+    if blob is None:
+        return
+    if blob.ref_count > 1:
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+    else:
+        blob.delete()
+        transaction.on_commit(lambda: base.storage.content_addressed_storage().delete(name))
+
+
+class Migration(migrations.Migration):
+    # Runs on its own, before 0017 adds the unique constraint, so PostgreSQL
+    # has no pending trigger events when the table is altered
+
+    dependencies = [
+        ('base', '0015_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_submissions, migrations.RunPython.noop),
+    ]
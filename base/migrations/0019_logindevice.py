@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0018_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_agent_hash', models.CharField(max_length=16)),
+                ('platform', models.CharField(blank=True, max_length=50)),
+                ('browser', models.CharField(blank=True, max_length=50)),
+                ('last_ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('login_count', models.IntegerField(default=1)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'user_agent_hash'), name='unique_login_device')],
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+import html
+import re
+from django.db import migrations
+from django.utils.html import strip_tags
+
+SQLITE_INDEX = [
+    # External-content FTS5 table over base_searchdocument, kept in step by
+    # triggers so bulk writes and raw SQL are indexed as well
+    """CREATE VIRTUAL TABLE base_searchdocument_fts USING fts5(
+        title, body, content='base_searchdocument', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER base_searchdocument_fts_insert AFTER INSERT ON base_searchdocument BEGIN
+        INSERT INTO base_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER base_searchdocument_fts_delete AFTER DELETE ON base_searchdocument BEGIN
+        INSERT INTO base_searchdocument_fts(base_searchdocument_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER base_searchdocument_fts_update AFTER UPDATE ON base_searchdocument BEGIN
+        INSERT INTO base_searchdocument_fts(base_searchdocument_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO base_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS base_searchdocument_fts_update',
+    'DROP TRIGGER IF EXISTS base_searchdocument_fts_delete',
+    'DROP TRIGGER IF EXISTS base_searchdocument_fts_insert',
+    'DROP TABLE IF EXISTS base_searchdocument_fts',
+]
+POSTGRES_INDEX = [
+    # Title words rank above body words
+    """ALTER TABLE base_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED""",
+    'CREATE INDEX base_searchdocument_vector_idx ON base_searchdocument USING GIN (search_vector)',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS base_searchdocument_vector_idx',
+    'ALTER TABLE base_searchdocument DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def html_to_text(value):
+    # As base.search.html_to_text() at the time of this migration
+    if not value:
+        return ''
+    text = strip_tags(re.sub(r'<(br|/p|/div|/li|/h\d)\b[^>]*>', ' ', value, flags=re.I))
+    return re.sub(r'\s+', ' ', html.unescape(text)).strip()
+
+def create_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(schema_editor.connection.vendor)
+    if statements is None:
+        raise RuntimeError('Full-text search needs SQLite or PostgreSQL')
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def drop_index(apps, schema_editor):
+    for statement in {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+def index_existing_rows(apps, schema_editor):
+    SearchDocument = apps.get_model('base', 'SearchDocument')
+    Quiz = apps.get_model('base', 'Quiz')
+    Submission = apps.get_model('base', 'Submission')
+    StudentComplaints = apps.get_model('base', 'StudentComplaints')
+    documents = [
+        SearchDocument(
+            kind='quiz', object_id=quiz.id, course_id=quiz.course_id,
+            title=f'{quiz.quiz_no} {quiz.quiz_title}'[:255], body=html_to_text(quiz.description),
+        )
+        for quiz in Quiz.objects.iterator()
+    ]
+    for submission in Submission.objects.exclude(remarks__isnull=True).exclude(remarks='').select_related('quiz', 'student').iterator():
+        text = html_to_text(submission.remarks)
+        if text:
+            documents.append(SearchDocument(
+                kind='remarks', object_id=submission.id, course_id=submission.course_id,
+                title=f'{submission.quiz.quiz_title}: remarks for {submission.student.username}'[:255], body=text,
+            ))
+    documents += [
+        SearchDocument(
+            kind='complaint', object_id=complaint.id,
+            title=f'Complaint from {complaint.student.username}'[:255], body=html_to_text(complaint.complaint),
+        )
+        for complaint in StudentComplaints.objects.select_related('student').iterator()
+    ]
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0020_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_existing_rows, migrations.RunPython.noop),
+    ]
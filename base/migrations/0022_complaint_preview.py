@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:24
+
+import html
+import re
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def complaint_preview(value):
+    # As base.services.complaint_preview() at the time of this migration
+    if not value:
+        return ''
+    text = strip_tags(re.sub(r'<(br|/p|/div|/li|/h\d)\b[^>]*>', ' ', value, flags=re.I))
+    return Truncator(re.sub(r'\s+', ' ', html.unescape(text)).strip()).chars(200)
+
+def fill_previews(apps, schema_editor):
+    StudentComplaints = apps.get_model('base', 'StudentComplaints')
+    batch = []
+    for complaint in StudentComplaints.objects.only('complaint').iterator(chunk_size=500):
+        complaint.preview = complaint_preview(complaint.complaint)
+        batch.append(complaint)
+        if len(batch) == 500:
+            StudentComplaints.objects.bulk_update(batch, ['preview'])
+            batch = []
+    StudentComplaints.objects.bulk_update(batch, ['preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0021_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentcomplaints',
+            name='preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='studentcomplaints',
+            index=models.Index(fields=['student', '-submitted_at', '-id'], name='complaint_student_recent_idx'),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+def render_descriptions(apps, schema_editor):
+    # The sanitizer is too long to copy here as other migrations do with
+    # their helpers; base.richtext is imported instead
+    from base.richtext import excerpt, sanitize_html
+    Quiz = apps.get_model('base', 'Quiz')
+    quizzes = list(Quiz.objects.only('description'))
+    for quiz in quizzes:
+        quiz.description_html = sanitize_html(quiz.description)
+        quiz.description_excerpt = excerpt(quiz.description, 300)
+    Quiz.objects.bulk_update(quizzes, ['description_html', 'description_excerpt'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0022_complaint_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='description_excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='description_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(render_descriptions, migrations.RunPython.noop),
+    ]
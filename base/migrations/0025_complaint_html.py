@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+def render_complaints(apps, schema_editor):
+    # As in 0023, base.richtext is imported rather than copied
+    from base.richtext import sanitize_html
+    StudentComplaints = apps.get_model('base', 'StudentComplaints')
+    complaints = list(StudentComplaints.objects.only('complaint'))
+    for complaint in complaints:
+        complaint.complaint_html = sanitize_html(complaint.complaint)
+    StudentComplaints.objects.bulk_update(complaints, ['complaint_html'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0024_updated_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentcomplaints',
+            name='complaint_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(render_complaints, migrations.RunPython.noop),
+    ]
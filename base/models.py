@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import os
+import uuid
+from .storage import content_addressed_storage
 
 def student_directory_path(instance, filename):
     ext = filename.split('.')[-1]
@@ -22,6 +25,7 @@ class StudentProfile(models.Model):
 class Courses(models.Model):
     course_title = models.CharField(max_length=200)
     course_no = models.CharField(max_length=200, unique=True)
+    updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.course_title
@@ -30,10 +34,21 @@ class Quiz(models.Model):
     quiz_title = models.CharField(max_length=200)
     quiz_no = models.CharField(max_length=200, unique=True)
     description = models.TextField()
-    help_file = models.FileField(upload_to='help_files/', null=True, blank=True)
+    # Sanitized `description` for display, and its plain-text start for the
+    # course's quiz list; both set on save
+    description_html = models.TextField(blank=True, default='', editable=False)
+    description_excerpt = models.CharField(max_length=300, blank=True, default='', editable=False)
+    help_file = models.FileField(upload_to='help_files/', storage=content_addressed_storage, null=True, blank=True)
     course = models.ForeignKey(Courses, on_delete=models.CASCADE,default=1)
     quiz_created_at = models.DateTimeField(auto_now_add=True)
-    due_date = models.DateTimeField()
+    due_date = models.DateTimeField(db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'due_date'], name='quiz_course_due_idx'),
+            models.Index(fields=['course', 'updated'], name='quiz_course_updated_idx'),
+        ]
 
     def __str__(self):
         return self.quiz_title
@@ -42,18 +57,151 @@ class Submission(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Courses, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
-    file = models.FileField(upload_to=student_directory_path)
+    file = models.FileField(upload_to=student_directory_path, storage=content_addressed_storage)
     submitted_at = models.DateTimeField(auto_now_add=True)
     marks = models.IntegerField(null=True, blank=True)
     remarks = models.TextField(null=True, blank=True)
-    
+    # Set by bulk_update callers too, the API's ETags depend on it
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # The unique (student, quiz) index also serves lookups by student alone
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'quiz'], name='unique_submission_per_quiz'),
+        ]
+        indexes = [
+            models.Index(fields=['student', 'course'], name='submission_student_course_idx'),
+            models.Index(fields=['course', '-submitted_at', '-id'], name='submission_course_recent_idx'),
+            models.Index(fields=['student', 'updated'], name='submission_student_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.student.username} - {self.course.course_no} - {self.quiz.quiz_no}"
 
 class StudentComplaints(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     complaint = models.TextField(null=True, blank=True)
-    submitted_at = models.DateTimeField(auto_now_add=True)
+    # Sanitized `complaint` for display, and its plain-text start for the
+    # inbox; both set on save
+    complaint_html = models.TextField(blank=True, default='', editable=False)
+    preview = models.CharField(max_length=200, blank=True, default='', editable=False)
+    submitted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', '-submitted_at', '-id'], name='complaint_student_recent_idx'),
+        ]
+
+    def __str__(self):
+        return self.student.username
+
+class StudentRanking(models.Model):
+    # Materialized leaderboard row, kept up to date as submissions are graded
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    total_marks = models.IntegerField(default=0)
+    graded_count = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_marks', 'user'], name='ranking_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.total_marks}"
+
+
+class UploadSession(models.Model):
+    # A chunked submission upload in progress, see base.uploads
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    student = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.student.username} - {self.filename} ({self.received}/{self.size})"
+
+class StoredBlob(models.Model):
+    # Reference count for a file in the content-addressed storage
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+class Job(models.Model):
+    # Deferred work run by `manage.py run_jobs`, see base.jobs
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.status})"
+
+
+class LoginDevice(models.Model):
+    # One row per user and user agent, see base.devices
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_agent_hash = models.CharField(max_length=16)
+    platform = models.CharField(max_length=50, blank=True)
+    browser = models.CharField(max_length=50, blank=True)
+    last_ip = models.GenericIPAddressField(null=True, blank=True)
+    login_count = models.IntegerField(default=1)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'user_agent_hash'], name='unique_login_device'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.browser or 'Unknown browser'} on {self.platform or 'Unknown Device'}"
+
+
+class SearchDocument(models.Model):
+    # Plain-text copy of a quiz description, submission remarks or complaint,
+    # kept in sync by base.signals. The full-text index over title and body
+    # lives outside the ORM (SQLite FTS5 table or PostgreSQL tsvector
+    # column), see migration 0021 and base.search.
+    QUIZ = 'quiz'
+    REMARKS = 'remarks'
+    COMPLAINT = 'complaint'
+    KIND_CHOICES = [(QUIZ, 'Quiz'), (REMARKS, 'Remarks'), (COMPLAINT, 'Complaint')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    course = models.ForeignKey(Courses, on_delete=models.CASCADE, null=True, blank=True)
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
 
     def __str__(self):
-        return self.student.username
\ No newline at end of file
+        return f"{self.get_kind_display()}: {self.title}"
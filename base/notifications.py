@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from .jobs import task
+from .models import Quiz, Submission
+
+# Emails sent by the job worker, never inside a request. A large mailing is
+# split into batches of ANNOUNCEMENT_BATCH_SIZE recipients, each its own job,
+# so a failure only retries the batch it happened in.
+ANNOUNCEMENT_BATCH_SIZE = 200
+
+
+def send_messages(messages):
+    # One SMTP connection for the whole batch
+    if messages:
+        with get_connection() as connection:
+            connection.send_messages(messages)
+
+@task
+def send_submission_receipt(submission_id):
+    submission = Submission.objects.select_related('student', 'quiz', 'course').filter(id=submission_id).first()
+    if submission is None or not submission.student.email:
+        return
+    send_messages([EmailMessage(
+        subject=f'Submission received: {submission.quiz.quiz_title}',
+        body=(
+            f'Hi {submission.student.first_name or submission.student.username},\n\n'
+            f'Your submission for "{submission.quiz.quiz_title}" ({submission.course.course_no}) was received.'
+        ),
+        to=[submission.student.email],
+    )])
+
+def enqueue_grade_notifications(submission_ids):
+    # Students without an email address don't get a job at all
+    submission_ids = list(
+        Submission.objects.filter(id__in=submission_ids).exclude(student__email='').values_list('id', flat=True),
+    )
+    if submission_ids:
+        send_grade_notifications.enqueue(submission_ids=submission_ids)
+
+@task
+def send_grade_notifications(submission_ids):
+    submissions = Submission.objects.filter(id__in=submission_ids, marks__isnull=False).exclude(
+        student__email='',
+    ).select_related('student', 'quiz', 'course')
+    send_messages([
+        EmailMessage(
+            subject=f'Quiz graded: {submission.quiz.quiz_title}',
+            body=(
+                f'Hi {submission.student.first_name or submission.student.username},\n\n'
+                f'Your submission for "{submission.quiz.quiz_title}" ({submission.course.course_no}) '
+                f'was graded: {submission.marks} marks.'
+            ),
+            to=[submission.student.email],
+        )
+        for submission in submissions
+    ])
+
+@task
+def announce_quiz(quiz_id):
+    # Fan out to one job per batch of students
+    if not Quiz.objects.filter(id=quiz_id).exists():
+        return
+    recipients = list(User.objects.filter(
+        is_active=True, is_staff=False, is_superuser=False,
+    ).exclude(email='').order_by('id').values_list('id', flat=True))
+    for start in range(0, len(recipients), ANNOUNCEMENT_BATCH_SIZE):
+        send_quiz_announcement.enqueue(quiz_id=quiz_id, user_ids=recipients[start:start + ANNOUNCEMENT_BATCH_SIZE])
+
+@task
+def send_quiz_announcement(quiz_id, user_ids):
+    quiz = Quiz.objects.select_related('course').filter(id=quiz_id).first()
+    if quiz is None:
+        return
+    users = User.objects.filter(id__in=user_ids, is_active=True).exclude(email='').only('email', 'first_name', 'username')
+    send_messages([
+        EmailMessage(
+            subject=f'New quiz: {quiz.quiz_title}',
+            body=(
+                f'Hi {user.first_name or user.username},\n\n'
+                f'A new quiz "{quiz.quiz_title}" was added to {quiz.course.course_no}. '
+                f'It is due on {timezone.localtime(quiz.due_date):%Y-%m-%d %H:%M}.'
+            ),
+            to=[user.email],
+        )
+        for user in users
+    ])
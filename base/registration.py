@@ -0,0 +1,127 @@
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from .caching import invalidate
+from .models import StudentProfile, StudentRanking
+
+# Bulk registration CSV layout, one user per row. `role` may be left out and
+# defaults to student.
+CSV_COLUMNS = ['reg_no', 'password', 'first_name', 'last_name', 'gender', 'role']
+REQUIRED_COLUMNS = ['reg_no', 'password', 'first_name', 'last_name', 'gender']
+GENDERS = ['Male', 'Female']
+ROLES = ['student', 'staff']
+CREATE_CHUNK_SIZE = 500
+
+
+def _init_hash_worker(settings_module):
+    # Spawned workers (Windows/macOS) start without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+def hash_passwords(passwords, workers=None):
+    # Password hashing is deliberately slow and CPU bound, so the
+    # import_students command spreads it over a process pool. Web requests
+    # pass workers=1: forking a pool per request inside a threaded server is
+    # neither safe nor cheap.
+    passwords = list(passwords)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'studybud.settings')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_hash_worker, initargs=(settings_module,)) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def read_registration_csv(uploaded_file):
+    reader = csv.DictReader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+def validate_rows(rows):
+    # Returns (valid, errors). Registration numbers are checked against the
+    # database with a single set-based lookup rather than one exists() each.
+    valid = []
+    errors = []
+    seen = set()
+    for line, row in enumerate(rows, start=2):
+        missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+        if missing:
+            errors.append((line, f'Missing {", ".join(missing)}'))
+            continue
+        row['gender'] = row['gender'].capitalize()
+        row['role'] = (row.get('role') or 'student').lower()
+        if row['gender'] not in GENDERS:
+            errors.append((line, f'Invalid gender "{row["gender"]}"'))
+        elif row['role'] not in ROLES:
+            errors.append((line, f'Invalid role "{row["role"]}". Only Student or Staff roles are allowed.'))
+        elif row['reg_no'] in seen:
+            errors.append((line, f'Duplicate registration number {row["reg_no"]} in file'))
+        else:
+            seen.add(row['reg_no'])
+            valid.append((line, row))
+
+    existing = set(User.objects.filter(username__in=seen).values_list('username', flat=True))
+    if existing:
+        errors += [(line, f'Registration number {row["reg_no"]} already exists') for line, row in valid if row['reg_no'] in existing]
+        valid = [(line, row) for line, row in valid if row['reg_no'] not in existing]
+    return valid, sorted(errors)
+
+def create_users(chunk):
+    # One transaction per chunk of ((line, row), password_hash) pairs
+    users = [
+        User(
+            username=row['reg_no'],
+            password=password,
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            is_staff=row['role'] == 'staff',
+            is_superuser=False,
+        )
+        for (_, row), password in chunk
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        StudentProfile.objects.bulk_create([
+            StudentProfile(user=user, gender=row['gender'])
+            for user, ((_, row), _) in zip(users, chunk)
+        ])
+        # bulk_create skips post_save, so seed the leaderboard rows here
+        StudentRanking.objects.bulk_create([StudentRanking(user=user) for user in users])
+    return len(users)
+
+def bulk_register(rows, workers=None, chunk_size=CREATE_CHUNK_SIZE):
+    # Returns (created, errors) where errors is a list of (line, message)
+    valid, errors = validate_rows(rows)
+    hashes = hash_passwords((row['password'] for _, row in valid), workers=workers)
+
+    created = 0
+    pending = iter(zip(valid, hashes))
+    while True:
+        chunk = list(islice(pending, chunk_size))
+        if not chunk:
+            break
+        while chunk:
+            try:
+                created += create_users(chunk)
+                break
+            except IntegrityError:
+                # Registered elsewhere since validate_rows(): report those
+                # rows and retry the rest of the chunk
+                taken = set(User.objects.filter(
+                    username__in=[row['reg_no'] for (_, row), _ in chunk],
+                ).values_list('username', flat=True))
+                if not taken:
+                    raise
+                errors += [
+                    (line, f'Registration number {row["reg_no"]} already exists')
+                    for (line, row), _ in chunk if row['reg_no'] in taken
+                ]
+                chunk = [((line, row), password) for (line, row), password in chunk if row['reg_no'] not in taken]
+    if created:
+        invalidate('rankings')
+    return created, sorted(errors)
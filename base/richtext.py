@@ -0,0 +1,117 @@
+import html
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+# Helpers for the CKEditor HTML stored on quizzes, remarks and complaints:
+# a plain-text version for previews and search, and an allow-list
+# sanitizer so stored HTML can be rendered with |safe.
+SPACE_RE = re.compile(r'\s+')
+# Browsers ignore these inside a URL scheme ("java\tscript:")
+URL_IGNORED_RE = re.compile(r'[\x00-\x20]+')
+DROPPED_TEXT_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.I | re.S)
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'del', 'em', 'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'i', 'img', 'li', 'mark', 'ol', 'p', 'pre', 's', 'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td',
+    'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'ol': {'start'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+URL_SCHEMES = {'', 'http', 'https', 'mailto'}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Dropped along with everything inside them
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'textarea', 'select'}
+
+
+def html_to_text(value):
+    if not value:
+        return ''
+    # Scripts and styles aren't text; keep words in adjacent block elements
+    # apart before removing the tags
+    value = DROPPED_TEXT_RE.sub(' ', value)
+    text = strip_tags(re.sub(r'<(br|/p|/div|/li|/h\d)\b[^>]*>', ' ', value, flags=re.I))
+    return SPACE_RE.sub(' ', html.unescape(text)).strip()
+
+def excerpt(value, length):
+    return Truncator(html_to_text(value)).chars(length)
+
+def allowed_url(value):
+    try:
+        scheme = urlsplit(URL_IGNORED_RE.sub('', value)).scheme
+    except ValueError:
+        return False
+    return scheme.lower() in URL_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        kept = []
+        for name, value in attrs:
+            if name not in ALLOWED_ATTRIBUTES.get(tag, ()) or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not allowed_url(value):
+                continue
+            kept.append(f' {name}="{html.escape(value)}"')
+        if tag == 'a':
+            kept.append(' rel="nofollow noopener"')
+        self.output.append(f'<{tag}{"".join(kept)}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # Close whatever was left open inside it as well
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.output.append(html.escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        return ''.join(self.output) + ''.join(f'</{tag}>' for tag in reversed(self.open_tags))
+
+
+def sanitize_html(value):
+    # Tags and attributes outside the lists above are removed (the text of
+    # removed tags is kept), links may only be http(s), mailto or relative,
+    # and every open tag is closed so the result can't break the page
+    # around it
+    if not value:
+        return ''
+    sanitizer = Sanitizer()
+    sanitizer.feed(value)
+    return sanitizer.result()
@@ -0,0 +1,179 @@
+import re
+from django.core.paginator import Paginator
+from django.db import connection
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import SearchDocument
+from .richtext import html_to_text
+
+# Full-text search over quiz descriptions, submission remarks and
+# complaints. The CKEditor HTML is reduced to text when a row is saved
+# (base.signals) and copied into SearchDocument; the database keeps the
+# full-text index over it (migration 0021):
+#   SQLite      base_searchdocument_fts, an FTS5 table maintained by triggers
+#   PostgreSQL  base_searchdocument.search_vector, a generated tsvector
+#               column with a GIN index
+WORD_RE = re.compile(r'\w+')
+# Private-use characters mark matches in snippets until they are escaped
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+SNIPPET_WORDS = 16
+SEARCH_PER_PAGE = 20
+
+
+def save_document(kind, object_id, title, body, course_id=None):
+    SearchDocument.objects.update_or_create(
+        kind=kind, object_id=object_id,
+        defaults={'title': title[:255], 'body': body, 'course_id': course_id},
+    )
+
+def remove_document(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+def index_quiz(quiz):
+    save_document(
+        SearchDocument.QUIZ, quiz.id, f'{quiz.quiz_no} {quiz.quiz_title}', html_to_text(quiz.description), quiz.course_id,
+    )
+
+def remarks_title(quiz, student):
+    return f'{quiz.quiz_title}: remarks for {student.username}'
+
+def index_remarks(submission):
+    text = html_to_text(submission.remarks)
+    if not text:
+        remove_document(SearchDocument.REMARKS, submission.id)
+        return
+    save_document(SearchDocument.REMARKS, submission.id, remarks_title(submission.quiz, submission.student), text, submission.course_id)
+
+def index_quiz_remarks(quiz, submissions):
+    # index_remarks() for a batch of one quiz's submissions, in two queries;
+    # `submission.student` must be loaded
+    SearchDocument.objects.filter(kind=SearchDocument.REMARKS, object_id__in=[submission.id for submission in submissions]).delete()
+    documents = []
+    for submission in submissions:
+        text = html_to_text(submission.remarks)
+        if text:
+            documents.append(SearchDocument(
+                kind=SearchDocument.REMARKS, object_id=submission.id, course_id=quiz.course_id,
+                title=remarks_title(quiz, submission.student)[:255], body=text,
+            ))
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+def index_complaint(complaint):
+    save_document(
+        SearchDocument.COMPLAINT, complaint.id, f'Complaint from {complaint.student.username}',
+        html_to_text(complaint.complaint),
+    )
+
+def document_url(document):
+    if document.kind == SearchDocument.QUIZ:
+        return reverse('quizzes', args=[document.course_id])
+    if document.kind == SearchDocument.REMARKS:
+        return reverse('view_remarks', args=[document.object_id])
+    return reverse('view_complaint', args=[document.object_id])
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+class SearchResults:
+    # Ranked matches for Paginator: count() and slicing each run one query,
+    # and only the requested page is fetched
+    def __init__(self, query, kinds=None):
+        self.words = WORD_RE.findall(query.lower())
+        self.kinds = list(kinds or [])
+        self._count = None
+
+    def filters(self):
+        sql = ''
+        params = []
+        if self.kinds:
+            sql = f' AND d.kind IN ({", ".join(["%s"] * len(self.kinds))})'
+            params = self.kinds
+        return sql, params
+
+    def match(self):
+        # Every word must match; the last one may be a prefix ("algo" finds
+        # "algorithm") since results update as the user types
+        if connection.vendor == 'postgresql':
+            return ' & '.join(self.words[:-1] + [f'{self.words[-1]}:*'])
+        return ' '.join(f'"{word}"' for word in self.words[:-1]) + f' "{self.words[-1]}"*'
+
+    def count(self):
+        if self._count is None:
+            if not self.words:
+                self._count = 0
+            else:
+                where, params = self.filters()
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'postgresql':
+                        cursor.execute(
+                            "SELECT COUNT(*) FROM base_searchdocument d "
+                            f"WHERE d.search_vector @@ to_tsquery('english', %s){where}",
+                            [self.match(), *params],
+                        )
+                    else:
+                        cursor.execute(
+                            "SELECT COUNT(*) FROM base_searchdocument_fts JOIN base_searchdocument d ON d.id = base_searchdocument_fts.rowid "
+                            f"WHERE base_searchdocument_fts MATCH %s{where}",
+                            [self.match(), *params],
+                        )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        if not isinstance(page, slice):
+            raise TypeError('SearchResults only supports slicing')
+        if not self.words:
+            return []
+        offset = page.start or 0
+        limit = page.stop - offset
+        where, params = self.filters()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    # PostgreSQL builds the headlines after the LIMIT
+                    f"SELECT d.id, ts_headline('english', d.body, q, 'StartSel={MATCH_START}, StopSel={MATCH_END}, "
+                    f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}') "
+                    "FROM base_searchdocument d, to_tsquery('english', %s) q "
+                    f"WHERE d.search_vector @@ q{where} ORDER BY ts_rank_cd(d.search_vector, q) DESC, d.id DESC LIMIT %s OFFSET %s",
+                    [self.match(), *params, limit, offset],
+                )
+                rows = cursor.fetchall()
+            else:
+                # bm25() is lower for better matches; title hits weigh more.
+                # Snippets are made for the page only, SQLite would
+                # otherwise build one for every match before sorting.
+                cursor.execute(
+                    "SELECT d.id, bm25(base_searchdocument_fts, 5.0, 1.0) AS rank "
+                    "FROM base_searchdocument_fts JOIN base_searchdocument d ON d.id = base_searchdocument_fts.rowid "
+                    f"WHERE base_searchdocument_fts MATCH %s{where} ORDER BY rank, d.id DESC LIMIT %s OFFSET %s",
+                    [self.match(), *params, limit, offset],
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                snippets = {}
+                if ids:
+                    cursor.execute(
+                        f"SELECT rowid, snippet(base_searchdocument_fts, -1, '{MATCH_START}', '{MATCH_END}', '...', {SNIPPET_WORDS}) "
+                        f"FROM base_searchdocument_fts WHERE base_searchdocument_fts MATCH %s AND rowid IN ({', '.join(['%s'] * len(ids))})",
+                        [self.match(), *ids],
+                    )
+                    snippets = dict(cursor.fetchall())
+                rows = [(document_id, snippets.get(document_id, '')) for document_id in ids]
+        documents = SearchDocument.objects.in_bulk([row[0] for row in rows])
+        results = []
+        for document_id, snippet in rows:
+            document = documents.get(document_id)
+            if document is None:
+                continue
+            document.snippet = highlight(snippet)
+            document.url = document_url(document)
+            results.append(document)
+        return results
+
+
+def get_search_page(query, page_number, kinds=None, per_page=SEARCH_PER_PAGE):
+    return Paginator(SearchResults(query, kinds), per_page).get_page(page_number)
@@ -0,0 +1,508 @@
+import base64
+from datetime import datetime, time, timedelta
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import Sum, Count, Q, F, BooleanField, ExpressionWrapper, FilteredRelation
+from .caching import invalidate
+from .notifications import enqueue_grade_notifications, send_submission_receipt
+from .richtext import excerpt, sanitize_html
+from .search import index_quiz_remarks
+from .models import Courses, Submission, StudentRanking, StudentComplaints, StoredBlob
+
+# ===============================
+# Dashboard Stats
+# ===============================
+
+def student_stats_queries(user):
+    # Two queries in total, no matter how many courses exist:
+    # one for the course catalogue (with quiz counts) and one grouped
+    # aggregate over the student's submissions.
+    courses = Courses.objects.annotate(quiz_count=Count('quiz')).order_by('id')
+    rows = Submission.objects.filter(student=user).values('course_id').annotate(
+        submitted=Count('id'),
+        graded=Count('id', filter=Q(marks__isnull=False)),
+        marks=Sum('marks'),
+    ).order_by()
+    return courses, rows
+
+def get_student_stats(user):
+    courses, rows = student_stats_queries(user)
+    return summarize_student_stats(list(courses), rows)
+
+async def aget_student_stats(user):
+    courses, rows = student_stats_queries(user)
+    return summarize_student_stats([course async for course in courses], [row async for row in rows])
+
+def summarize_student_stats(courses, rows):
+    per_course = {row['course_id']: row for row in rows}
+
+    total_submissions = 0
+    total_graded = 0
+    total_marks = 0
+    total_quizzes = 0
+    for course in courses:
+        row = per_course.get(course.id, {})
+        submitted = row.get('submitted', 0)
+        graded = row.get('graded', 0)
+        marks = row.get('marks') or 0
+        course.stats = {
+            'submitted': submitted,
+            'graded': graded,
+            'marks': marks,
+            'average': round(marks / graded, 2) if graded else 0,
+        }
+        total_submissions += submitted
+        total_graded += graded
+        total_marks += marks
+        total_quizzes += course.quiz_count
+
+    return {
+        'courses': courses,
+        'total_courses': len(courses),
+        'total_submissions': total_submissions,
+        'total_graded': total_graded,
+        'total_marks': total_marks,
+        'total_quizzes_available': total_quizzes,
+        'pending_quizzes': total_quizzes - total_submissions,
+        'average_score': round(total_marks / total_graded, 2) if total_graded else 0,
+    }
+
+# ===============================
+# Submissions
+# ===============================
+
+def save_submission(student, quiz, file):
+    # Replace the file of an existing submission, or create the submission.
+    # The existing row is locked for the update, and a concurrent first
+    # submission loses on unique_submission_per_quiz and updates the winner's
+    # row instead. The replaced file is released once the transaction
+    # commits, see base.signals. The receipt email goes out from the job
+    # worker.
+    with transaction.atomic():
+        submission, _ = Submission.objects.update_or_create(
+            student=student, quiz=quiz,
+            defaults={'file': file},
+            create_defaults={'course': quiz.course, 'file': file},
+        )
+        if student.email:
+            send_submission_receipt.enqueue(submission_id=submission.id)
+    return submission
+
+# ===============================
+# Quiz Roster
+# ===============================
+
+ROSTER_PER_PAGE = 50
+
+ROSTER_SORTS = {
+    'name': ('first_name', 'last_name', 'username'),
+    '-name': ('-first_name', '-last_name', '-username'),
+    'submitted_at': (F('submitted_at').asc(nulls_last=True), 'username'),
+    '-submitted_at': (F('submitted_at').desc(nulls_last=True), 'username'),
+    'marks': (F('marks').asc(nulls_last=True), 'username'),
+    '-marks': (F('marks').desc(nulls_last=True), 'username'),
+}
+
+ROSTER_FILTERS = {
+    'submitted': Q(submission_id__isnull=False),
+    'not_submitted': Q(submission_id__isnull=True),
+    'graded': Q(marks__isnull=False),
+    'ungraded': Q(submission_id__isnull=False, marks__isnull=True),
+}
+
+def quiz_roster_queryset(quiz, status=None, sort=None):
+    # Every student paired with their submission for this quiz (if any)
+    # through a single LEFT JOIN, so sorting and filtering happen in SQL.
+    students = User.objects.filter(is_staff=False, is_superuser=False).annotate(
+        quiz_submission=FilteredRelation('submission', condition=Q(submission__quiz=quiz)),
+        submission_id=F('quiz_submission__id'),
+        submitted_at=F('quiz_submission__submitted_at'),
+        marks=F('quiz_submission__marks'),
+        file=F('quiz_submission__file'),
+        has_remarks=ExpressionWrapper(
+            Q(quiz_submission__remarks__isnull=False) & ~Q(quiz_submission__remarks=''),
+            output_field=BooleanField(),
+        ),
+    ).only('username', 'first_name', 'last_name')
+    if status in ROSTER_FILTERS:
+        students = students.filter(ROSTER_FILTERS[status])
+    return students.order_by(*ROSTER_SORTS.get(sort, ROSTER_SORTS['name']))
+
+def get_quiz_roster_page(quiz, page_number, status=None, sort=None, per_page=ROSTER_PER_PAGE):
+    page = Paginator(quiz_roster_queryset(quiz, status, sort), per_page).get_page(page_number)
+    page.object_list = list(page.object_list)
+    for user in page.object_list:
+        user.submission = None
+        if user.submission_id is not None:
+            user.submission = Submission(
+                id=user.submission_id, student_id=user.id, quiz_id=quiz.id, course_id=quiz.course_id,
+                file=user.file, submitted_at=user.submitted_at, marks=user.marks,
+            )
+    return page
+
+def get_quiz_submission_counts(quiz):
+    return Submission.objects.filter(quiz=quiz, student__is_staff=False, student__is_superuser=False).aggregate(
+        submitted=Count('id'),
+        graded=Count('id', filter=Q(marks__isnull=False)),
+    )
+
+# ===============================
+# Submission Listing
+# ===============================
+
+SUBMISSIONS_PER_PAGE = 50
+
+def submission_listing(course=None, quiz_id=None, status=None, date_from=None, date_to=None):
+    # Rows carry the student, quiz and course columns the listing templates
+    # need, fetched in the same query.
+    submissions = Submission.objects.select_related('student', 'quiz', 'course').only(
+        'file', 'submitted_at', 'marks',
+        'student__username', 'student__first_name', 'student__last_name',
+        'quiz__quiz_title', 'quiz__quiz_no',
+        'course__course_title', 'course__course_no',
+    )
+    if course is not None:
+        submissions = submissions.filter(course=course)
+    if quiz_id:
+        submissions = submissions.filter(quiz_id=quiz_id)
+    if status == 'graded':
+        submissions = submissions.filter(marks__isnull=False)
+    elif status == 'ungraded':
+        submissions = submissions.filter(marks__isnull=True)
+    return filter_submitted_between(submissions, date_from, date_to)
+
+def filter_submitted_between(rows, date_from, date_to):
+    # Both dates are inclusive, 'YYYY-MM-DD' strings; invalid ones are ignored
+    date_from = parse_date(date_from or '')
+    date_to = parse_date(date_to or '')
+    if date_from:
+        rows = rows.filter(submitted_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        rows = rows.filter(submitted_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    return rows
+
+def encode_cursor(row):
+    value = f"{row.submitted_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        submitted_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        submitted_at = parse_datetime(submitted_at)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        return None
+    if submitted_at is None:
+        return None
+    return submitted_at, pk
+
+def get_keyset_page(queryset, after=None, before=None, per_page=SUBMISSIONS_PER_PAGE):
+    # Keyset pagination on (submitted_at, id), newest first. Each page is a
+    # single indexed range scan no matter how deep it is, unlike OFFSET.
+    # `after` moves to older rows, `before` back to newer ones. Returns the
+    # page's rows and the cursors to the pages around it.
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    if before:
+        submitted_at, pk = before
+        rows = list(queryset.filter(
+            Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, id__gt=pk)
+        ).order_by('submitted_at', 'id')[:per_page + 1])
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_newer, has_older = has_more, True
+    else:
+        if after:
+            submitted_at, pk = after
+            queryset = queryset.filter(
+                Q(submitted_at__lt=submitted_at) | Q(submitted_at=submitted_at, id__lt=pk)
+            )
+        rows = list(queryset.order_by('-submitted_at', '-id')[:per_page + 1])
+        has_older = len(rows) > per_page
+        rows = rows[:per_page]
+        has_newer = after is not None
+    return (
+        rows,
+        encode_cursor(rows[-1]) if rows and has_older else None,
+        encode_cursor(rows[0]) if rows and has_newer else None,
+    )
+
+def get_submission_page(submissions, after=None, before=None, per_page=SUBMISSIONS_PER_PAGE):
+    rows, next_cursor, prev_cursor = get_keyset_page(submissions, after, before, per_page)
+    return {'submissions': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+# ===============================
+# Quiz Descriptions
+# ===============================
+
+QUIZ_EXCERPT_LENGTH = 300
+
+def render_description(quiz):
+    # The course's quiz list shows the excerpt and loads the sanitized HTML
+    # on demand (quiz_description view), so its size doesn't grow with the
+    # descriptions
+    quiz.description_html = sanitize_html(quiz.description)
+    quiz.description_excerpt = excerpt(quiz.description, QUIZ_EXCERPT_LENGTH)
+    return quiz
+
+# ===============================
+# Complaints Inbox
+# ===============================
+
+COMPLAINTS_PER_PAGE = 25
+COMPLAINT_PREVIEW_LENGTH = 200
+
+def render_complaint(complaint):
+    # The complaint is student-written HTML shown to staff, so only its
+    # sanitized version is rendered. The plain-text start is stored too so
+    # the inbox never loads or cleans the full HTML. Both are set on save,
+    # see base.signals.
+    complaint.complaint_html = sanitize_html(complaint.complaint)
+    complaint.preview = excerpt(complaint.complaint, COMPLAINT_PREVIEW_LENGTH)
+    return complaint
+
+def complaint_listing(student=None, date_from=None, date_to=None):
+    complaints = StudentComplaints.objects.select_related('student').only(
+        'preview', 'submitted_at', 'student__username', 'student__first_name', 'student__last_name',
+    )
+    if student:
+        complaints = complaints.filter(student__username=student)
+    return filter_submitted_between(complaints, date_from, date_to)
+
+def get_complaint_page(complaints, after=None, before=None, per_page=COMPLAINTS_PER_PAGE):
+    rows, next_cursor, prev_cursor = get_keyset_page(complaints, after, before, per_page)
+    return {'complaints': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+# ===============================
+# Leaderboard
+# ===============================
+
+RANKINGS_PER_PAGE = 50
+
+def ranking_queryset():
+    # Ties on total marks are broken by user id so that every student has a
+    # stable position, both in the paginated table and in get_user_rank().
+    return StudentRanking.objects.order_by('-total_marks', 'user_id')
+
+def rankings_paginator(per_page):
+    entries = ranking_queryset().select_related('user').only(
+        'total_marks', 'graded_count', 'user__username', 'user__first_name', 'user__last_name',
+    )
+    return Paginator(entries, per_page)
+
+def number_entries(page):
+    for rank, entry in enumerate(page.object_list, start=page.start_index()):
+        entry.rank = rank
+    return page
+
+def find_rankings_page(page_number, per_page=RANKINGS_PER_PAGE):
+    # The page to show, with missing, malformed and out-of-range numbers
+    # resolved to a real one, so its number can go in a cache key. Costs one
+    # COUNT; the entries are only loaded by load_rankings_page().
+    return rankings_paginator(per_page).get_page(page_number)
+
+async def afind_rankings_page(page_number, per_page=RANKINGS_PER_PAGE):
+    paginator = rankings_paginator(per_page)
+    # Paginator counts synchronously; fill in its cached count first
+    paginator.count = await paginator.object_list.acount()
+    return paginator.get_page(page_number)
+
+def load_rankings_page(page):
+    page.object_list = list(page.object_list)
+    return number_entries(page)
+
+async def aload_rankings_page(page):
+    page.object_list = [entry async for entry in page.object_list]
+    return number_entries(page)
+
+def get_rankings_page(page_number, per_page=RANKINGS_PER_PAGE):
+    return load_rankings_page(find_rankings_page(page_number, per_page))
+
+def users_ahead(entry):
+    # Index range count on (total_marks, user) instead of scanning the table
+    return StudentRanking.objects.filter(
+        Q(total_marks__gt=entry.total_marks) | Q(total_marks=entry.total_marks, user_id__lt=entry.user_id)
+    )
+
+def get_user_rank(user):
+    entry = StudentRanking.objects.filter(user=user).first()
+    if entry is None:
+        return None
+    entry.rank = users_ahead(entry).count() + 1
+    return entry
+
+async def aget_user_rank(user):
+    entry = await StudentRanking.objects.filter(user=user).afirst()
+    if entry is None:
+        return None
+    entry.rank = await users_ahead(entry).acount() + 1
+    return entry
+
+def record_marks_change(student_id, old_marks, new_marks):
+    # Apply the difference between the previous and new marks of a single
+    # submission to the student's leaderboard row.
+    marks_delta = (new_marks or 0) - (old_marks or 0)
+    graded_delta = (new_marks is not None) - (old_marks is not None)
+    if not marks_delta and not graded_delta:
+        return
+    StudentRanking.objects.filter(user_id=student_id).update(
+        total_marks=F('total_marks') + marks_delta,
+        graded_count=F('graded_count') + graded_delta,
+        updated=timezone.now(),
+    )
+    # update() sends no signals
+    invalidate('rankings')
+
+def refresh_rankings(student_ids):
+    # Recompute the rows of a known set of students in two queries, used
+    # after batch writes where per-row deltas would cost one UPDATE each.
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    totals = {
+        row['student_id']: row
+        for row in Submission.objects.filter(student_id__in=student_ids, marks__isnull=False).values('student_id').annotate(
+            total_marks=Sum('marks'), graded_count=Count('id'),
+        ).order_by()
+    }
+    rankings = list(StudentRanking.objects.filter(user_id__in=student_ids))
+    for ranking in rankings:
+        ranking.total_marks = totals.get(ranking.user_id, {}).get('total_marks', 0)
+        ranking.graded_count = totals.get(ranking.user_id, {}).get('graded_count', 0)
+        ranking.updated = timezone.now()
+    StudentRanking.objects.bulk_update(rankings, ['total_marks', 'graded_count', 'updated'], batch_size=500)
+    # bulk_update sends no signals
+    invalidate('rankings', *(f'user:{student_id}' for student_id in student_ids))
+
+@transaction.atomic
+def rebuild_rankings():
+    # Full recomputation, used to seed the table and to repair drift
+    totals = {
+        row['student_id']: row
+        for row in Submission.objects.filter(marks__isnull=False).values('student_id').annotate(
+            total_marks=Sum('marks'), graded_count=Count('id'),
+        ).order_by()
+    }
+    StudentRanking.objects.all().delete()
+    StudentRanking.objects.bulk_create([
+        StudentRanking(
+            user_id=user_id,
+            total_marks=totals.get(user_id, {}).get('total_marks', 0),
+            graded_count=totals.get(user_id, {}).get('graded_count', 0),
+        )
+        for user_id in User.objects.values_list('id', flat=True)
+    ], batch_size=1000)
+    invalidate('rankings')
+
+# ===============================
+# Bulk Grading
+# ===============================
+
+MIN_MARKS = 0
+MAX_MARKS = 10
+
+def parse_marks(value):
+    try:
+        marks = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Marks must be a whole number')
+    if marks < MIN_MARKS or marks > MAX_MARKS:
+        raise ValueError(f'Marks must be between {MIN_MARKS} and {MAX_MARKS}')
+    return marks
+
+def bulk_grade(quiz, grades):
+    # `grades` maps submission id -> (marks, remarks); remarks may be None to
+    # leave them untouched, and a row without marks is skipped. Every row is validated first, the valid ones are
+    # written with one bulk_update inside a transaction and the leaderboard
+    # is refreshed once for the whole batch; students are notified by the
+    # job worker. Returns (updated, errors).
+    submissions = {
+        submission.id: submission
+        for submission in Submission.objects.filter(quiz=quiz, id__in=list(grades)).select_related('student').only(
+            'marks', 'remarks', 'student__username',
+        )
+    }
+    errors = []
+    changed = []
+    remarked = set()
+    for submission_id, (marks, remarks) in grades.items():
+        submission = submissions.get(submission_id)
+        if submission is None:
+            errors.append((submission_id, 'Submission not found for this quiz'))
+            continue
+        if marks is None:
+            errors.append((submission.student.username, 'Remarks are only saved together with marks, row skipped'))
+            continue
+        try:
+            submission.marks = parse_marks(marks)
+        except ValueError as e:
+            errors.append((submission.student.username, str(e)))
+            continue
+        if remarks is not None:
+            submission.remarks = remarks
+            remarked.add(submission.id)
+        changed.append(submission)
+
+    if changed:
+        fields = ['marks', 'remarks', 'updated'] if remarked else ['marks', 'updated']
+        now = timezone.now()
+        for submission in changed:
+            submission.updated = now
+        with transaction.atomic():
+            Submission.objects.bulk_update(changed, fields, batch_size=500)
+            refresh_rankings(submission.student_id for submission in changed)
+            if remarked:
+                # bulk_update sends no signals
+                index_quiz_remarks(quiz, [submission for submission in changed if submission.id in remarked])
+            enqueue_grade_notifications([submission.id for submission in changed])
+    return len(changed), errors
+
+# ===============================
+# Stored Blobs
+# ===============================
+
+def retain_blob(name):
+    if not name:
+        return
+    updated = StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+    if not updated:
+        blob, created = StoredBlob.objects.get_or_create(name=name, defaults={'ref_count': 1})
+        if not created:
+            StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+def lock_blob(name):
+    # Called by the storage before it reuses or writes a blob. The row, a
+    # placeholder without references if the blob is new, stays locked until
+    # the caller's transaction ends and its post_save has retained the blob.
+    StoredBlob.objects.get_or_create(name=name, defaults={'ref_count': 0})
+    if transaction.get_connection().in_atomic_block:
+        StoredBlob.objects.select_for_update().filter(name=name).first()
+
+def release_blob(name, storage):
+    # Drop one reference; the file is deleted after commit when the last
+    # reference goes away and nothing re-acquired it in the meantime.
+    if not name:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+
+    def delete_file():
+        # Another upload of the same content may have locked the blob in the
+        # meantime; wait for it and keep the file if it took a reference
+        with transaction.atomic():
+            StoredBlob.objects.get_or_create(name=name, defaults={'ref_count': 0})
+            blob = StoredBlob.objects.select_for_update().get(name=name)
+            if blob.ref_count > 0:
+                return
+            storage.delete(name)
+            blob.delete()
+    transaction.on_commit(delete_file)
@@ -0,0 +1,221 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.fields.files import FieldFile
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .caching import invalidate
+from .devices import record_login_device
+from .instrumentation import install_query_timer
+from .models import Courses, Quiz, Submission, StudentProfile, StudentRanking, StudentComplaints, SearchDocument
+from .search import index_quiz, index_remarks, index_complaint, remove_document
+from .services import render_complaint, render_description, record_marks_change, retain_blob, release_blob
+
+# File fields backed by the content-addressed storage, whose blobs are
+# reference counted as rows start or stop pointing at them.
+BLOB_FIELDS = {Submission: 'file', Quiz: 'help_file'}
+DEFERRED = object()
+# Shown on the leaderboard
+RANKED_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def stored_file_name(instance, field_name):
+    # Name of the file already in storage, without loading deferred fields
+    if field_name not in instance.__dict__:
+        return DEFERRED
+    value = instance.__dict__[field_name]
+    if isinstance(value, FieldFile):
+        return value.name if value._committed and value.name else None
+    if isinstance(value, str):
+        return value or None
+    return None
+
+
+@receiver(post_save, sender=User)
+def create_student_ranking(sender, instance, created, raw=False, **kwargs):
+    # Every user gets a leaderboard row so that ungraded students still rank
+    if created and not raw:
+        StudentRanking.objects.get_or_create(user=instance)
+
+# Leaderboard rows follow every save of a submission's marks (views, admin,
+# shell). The marks are remembered as loaded; a grader that must not race
+# another one loads the row with select_for_update() inside its transaction.
+# bulk_update callers refresh the rankings themselves.
+
+@receiver(post_init, sender=Submission)
+def remember_marks(sender, instance, **kwargs):
+    instance._recorded_marks = instance.__dict__.get('marks', DEFERRED)
+
+@receiver(pre_save, sender=Submission)
+def load_recorded_marks(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or instance._recorded_marks is not DEFERRED:
+        return
+    if 'marks' in instance.__dict__ and (update_fields is None or 'marks' in update_fields):
+        instance._recorded_marks = Submission.objects.filter(pk=instance.pk).values_list('marks', flat=True).first()
+
+@receiver(post_save, sender=Submission)
+def record_submission_marks(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or 'marks' not in instance.__dict__:
+        return
+    if update_fields is not None and 'marks' not in update_fields:
+        return
+    previous = None if created else instance._recorded_marks
+    if previous is DEFERRED:
+        return
+    record_marks_change(instance.student_id, previous, instance.marks)
+    instance._recorded_marks = instance.marks
+
+@receiver(post_delete, sender=Submission)
+def remove_submission_marks(sender, instance, **kwargs):
+    record_marks_change(instance.student_id, instance.marks, None)
+
+@receiver(post_init, sender=Submission)
+@receiver(post_init, sender=Quiz)
+def remember_stored_file(sender, instance, **kwargs):
+    instance._stored_file = stored_file_name(instance, BLOB_FIELDS[sender])
+
+@receiver(pre_save, sender=Submission)
+@receiver(pre_save, sender=Quiz)
+def find_replaced_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    field_name = BLOB_FIELDS[sender]
+    instance._replaced_file = DEFERRED
+    if raw or field_name not in instance.__dict__:
+        return
+    if update_fields is not None and field_name not in update_fields:
+        return
+    previous = getattr(instance, '_stored_file', DEFERRED)
+    if instance._state.adding:
+        previous = None
+    elif previous is DEFERRED:
+        previous = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first() or None
+    instance._replaced_file = previous
+
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=Quiz)
+def update_blob_references(sender, instance, **kwargs):
+    previous = getattr(instance, '_replaced_file', DEFERRED)
+    if previous is DEFERRED:
+        return
+    current = getattr(instance, BLOB_FIELDS[sender]).name or None
+    if current != previous:
+        retain_blob(current)
+        release_blob(previous, getattr(instance, BLOB_FIELDS[sender]).storage)
+    instance._stored_file = current
+    instance._replaced_file = DEFERRED
+
+@receiver(post_delete, sender=Submission)
+@receiver(post_delete, sender=Quiz)
+def release_deleted_file(sender, instance, **kwargs):
+    name = stored_file_name(instance, BLOB_FIELDS[sender])
+    if name is not DEFERRED:
+        release_blob(name, getattr(instance, BLOB_FIELDS[sender]).storage)
+
+@receiver(pre_save, sender=Quiz)
+def render_quiz_description(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or 'description' not in instance.__dict__:
+        return
+    if update_fields is not None and 'description' not in update_fields:
+        return
+    render_description(instance)
+
+@receiver(post_save, sender=Quiz)
+def index_quiz_description(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_quiz(instance)
+
+@receiver(post_init, sender=Submission)
+def remember_remarks(sender, instance, **kwargs):
+    instance._indexed_remarks = instance.__dict__.get('remarks', DEFERRED)
+
+@receiver(post_save, sender=Submission)
+def index_submission_remarks(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Only when the remarks changed: a resubmission or grading leaves the
+    # index alone
+    if raw or 'remarks' not in instance.__dict__:
+        return
+    if update_fields is not None and 'remarks' not in update_fields:
+        return
+    previous = None if created else instance._indexed_remarks
+    if previous != instance.remarks:
+        index_remarks(instance)
+        instance._indexed_remarks = instance.remarks
+
+@receiver(pre_save, sender=StudentComplaints)
+def render_complaint_text(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or 'complaint' not in instance.__dict__:
+        return
+    if update_fields is not None and 'complaint' not in update_fields:
+        return
+    render_complaint(instance)
+
+@receiver(post_save, sender=StudentComplaints)
+def index_complaint_text(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_complaint(instance)
+
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Submission)
+@receiver(post_delete, sender=StudentComplaints)
+def remove_search_document(sender, instance, **kwargs):
+    kind = {Quiz: SearchDocument.QUIZ, Submission: SearchDocument.REMARKS, StudentComplaints: SearchDocument.COMPLAINT}[sender]
+    remove_document(kind, instance.id)
+
+# Fragment cache invalidation, see base.caching for the scopes
+
+@receiver(post_save, sender=Courses)
+@receiver(post_delete, sender=Courses)
+def invalidate_course_fragments(sender, instance, **kwargs):
+    invalidate('catalogue', f'course:{instance.id}')
+
+@receiver(post_init, sender=Quiz)
+def remember_quiz_course(sender, instance, **kwargs):
+    instance._loaded_course_id = instance.__dict__.get('course_id')
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def invalidate_quiz_fragments(sender, instance, **kwargs):
+    # A quiz moved to another course also leaves its old course's page
+    courses = {instance.course_id, getattr(instance, '_loaded_course_id', None)} - {None}
+    invalidate('catalogue', *(f'course:{course_id}' for course_id in courses))
+    instance._loaded_course_id = instance.course_id
+
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def invalidate_submission_fragments(sender, instance, **kwargs):
+    # 'rankings' is bumped by record_marks_change(), only when marks change
+    invalidate(f'user:{instance.student_id}')
+
+@receiver(post_init, sender=User)
+def remember_ranked_names(sender, instance, **kwargs):
+    instance._ranked_names = tuple(instance.__dict__.get(field) for field in RANKED_USER_FIELDS)
+
+@receiver(post_save, sender=User)
+def invalidate_user_fragments(sender, instance, created, update_fields=None, **kwargs):
+    # login() saves last_login alone, which no fragment shows
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    names = tuple(instance.__dict__.get(field) for field in RANKED_USER_FIELDS)
+    if created or names != instance._ranked_names:
+        invalidate(f'user:{instance.id}', 'rankings')
+    else:
+        invalidate(f'user:{instance.id}')
+    instance._ranked_names = names
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=StudentRanking)
+def invalidate_ranked_user_fragments(sender, instance, **kwargs):
+    user_id = instance.id if sender is User else instance.user_id
+    invalidate(f'user:{user_id}', 'rankings')
+
+@receiver(post_save, sender=StudentProfile)
+def invalidate_profile_fragments(sender, instance, **kwargs):
+    invalidate(f'user:{instance.user_id}')
+
+@receiver(user_logged_in)
+def remember_login_device(sender, request, user, **kwargs):
+    if request is not None:
+        record_login_device(user, request)
+
+@receiver(connection_created)
+def time_connection_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import tempfile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = 'blobs'
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Stores every file under the SHA-256 of its bytes, so identical uploads
+    # share one blob on disk. The name generated by upload_to only
+    # contributes its extension. Blobs are removed by
+    # base.services.release_blob() once no row refers to them any more.
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content, an existing blob is reused as is
+        return name
+
+    def _save(self, name, content):
+        # base.models imports this module
+        from .services import lock_blob
+
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(BLOB_DIR), exist_ok=True)
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it in place and move it if it is new
+            source = content.temporary_file_path()
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+        else:
+            # Hash while streaming into a temporary file next to the blobs
+            fd, source = tempfile.mkstemp(dir=self.path(BLOB_DIR), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+
+        hexdigest = digest.hexdigest()
+        name = f'{BLOB_DIR}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}'
+        full_path = self.path(name)
+        # Lock the blob's row first, so a release that drops its last
+        # reference can't delete the file after it has been found here
+        lock_blob(name)
+        if os.path.exists(full_path):
+            if not hasattr(content, 'temporary_file_path'):
+                os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # The upload's temporary file may be on another filesystem
+            file_move_safe(source, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+
+def content_addressed_storage():
+    return ContentAddressedStorage()
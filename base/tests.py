@@ -1,3 +1,1343 @@
-from django.test import TestCase
+import errno
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.messages.storage import default_storage
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import IntegrityError, connection, connections
+from django.db.models import Count
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import Http404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+import httpagentparser
+from . import views
+from .benchmarks import compare, generate_data, remove_data
+from .caching import get_versions
+from .devices import get_device, parse_user_agent
+from .instrumentation import metrics
+from .jobs import TASKS, claim_job, enqueue, run_job, run_pending_jobs, task
+from .models import (
+    Courses, Job, LoginDevice, Quiz, SearchDocument, Submission, StudentComplaints, StudentProfile, StudentRanking, StoredBlob, UploadSession,
+)
+from .notifications import announce_quiz
+from .registration import hash_passwords, validate_rows
+from .uploads import start_upload
+from .search import SearchResults, html_to_text
+from .services import (
+    get_student_stats, get_rankings_page, get_user_rank, rebuild_rankings, quiz_roster_queryset,
+    submission_listing, get_submission_page, complaint_listing, get_complaint_page, bulk_grade,
+)
 
-# Create your tests here.
+
+def make_course(n):
+    return Courses.objects.create(course_title=f'Course {n}', course_no=f'CS-{n}')
+
+def make_quiz(course, n):
+    return Quiz.objects.create(
+        quiz_title=f'Quiz {n}', quiz_no=f'Q-{n}', description='<p>Quiz</p>',
+        course=course, due_date=timezone.now() + timedelta(days=1),
+    )
+
+def make_student(username, **extra):
+    user = User.objects.create(username=username, **extra)
+    StudentProfile.objects.create(user=user, gender='Male')
+    return user
+
+def make_submission(student, quiz, marks=None):
+    return Submission.objects.create(
+        student=student, course=quiz.course, quiz=quiz, file=f'{quiz.course.course_no}/x.txt', marks=marks,
+    )
+
+
+class QueryBudgetMixin:
+    # Fails the test when the block issues more than `budget` queries, and
+    # lists them. Unlike assertNumQueries, getting cheaper never fails.
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, 1))
+            self.fail(f'{len(context)} queries, over the budget of {budget}:\n{queries}')
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.student = make_student('student1')
+
+    def seed(self, num_courses):
+        for i in range(num_courses):
+            course = make_course(f'{num_courses}-{i}')
+            for j in range(2):
+                quiz = make_quiz(course, f'{num_courses}-{i}-{j}')
+                make_submission(self.student, quiz, marks=j * 5 or None)
+
+    def test_stats_values(self):
+        self.seed(2)
+        stats = get_student_stats(self.student)
+        self.assertEqual(stats['total_courses'], 2)
+        self.assertEqual(stats['total_submissions'], 4)
+        self.assertEqual(stats['total_graded'], 2)
+        self.assertEqual(stats['total_marks'], 10)
+        self.assertEqual(stats['total_quizzes_available'], 4)
+        self.assertEqual(stats['pending_quizzes'], 0)
+        self.assertEqual(stats['average_score'], 5)
+        self.assertEqual(stats['courses'][0].stats, {'submitted': 2, 'graded': 1, 'marks': 5, 'average': 5})
+
+    def test_stats_query_count_is_constant(self):
+        self.seed(3)
+        with self.assertNumQueries(2):
+            get_student_stats(self.student)
+        self.seed(30)
+        with self.assertNumQueries(2):
+            get_student_stats(self.student)
+
+    def test_dashboard_query_count_does_not_grow_with_courses(self):
+        self.client.force_login(self.student)
+        self.seed(3)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.seed(30)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+
+class QuizListTests(TestCase):
+    def setUp(self):
+        self.student = make_student('student1')
+        self.course = make_course(1)
+        self.client.force_login(self.student)
+
+    def test_submissions_are_matched_per_quiz(self):
+        submitted, open_quiz = make_quiz(self.course, 1), make_quiz(self.course, 2)
+        submission = make_submission(self.student, submitted)
+        make_submission(self.student, make_quiz(make_course(2), 3))
+        response = self.client.get(reverse('quizzes', args=[self.course.id]))
+        self.assertEqual(list(response.context['submissions']), [submitted.id])
+        self.assertContains(response, reverse('download_submission', args=[submission.id]), count=1)
+        self.assertContains(response, reverse('submit_quiz', args=[open_quiz.id]))
+
+    def test_query_count_does_not_grow_with_quizzes(self):
+        url = reverse('quizzes', args=[self.course.id])
+        make_submission(self.student, make_quiz(self.course, 0))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for n in range(1, 20):
+            make_submission(self.student, make_quiz(self.course, n))
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(len(small), len(large))
+
+    def test_list_shows_excerpts_and_loads_descriptions_on_demand(self):
+        quiz = make_quiz(self.course, 1)
+        quiz.description = (
+            '<p onclick="x()">Read <a href="javascript:alert(1)">this</a> and <a href="https://example.com">that</a></p>'
+            '<script>alert(1)</script><img src="/media/graph.png" onerror="x()">' + '<p>More detail.</p>' * 100
+        )
+        quiz.save()
+        self.assertTrue(quiz.description_html.startswith(
+            '<p>Read <a rel="nofollow noopener">this</a> and <a href="https://example.com" rel="nofollow noopener">that</a></p>'
+            '<img src="/media/graph.png"><p>More detail.</p>'
+        ))
+        self.assertNotIn('script', quiz.description_html)
+        self.assertTrue(quiz.description_excerpt.startswith('Read this and that More detail.'))
+        self.assertLessEqual(len(quiz.description_excerpt), 300)
+
+        response = self.client.get(reverse('quizzes', args=[self.course.id]))
+        self.assertContains(response, 'Read this and that')
+        self.assertNotContains(response, 'graph.png')
+        self.assertContains(response, reverse('quiz_description', args=[quiz.id]))
+        response = self.client.get(reverse('quiz_description', args=[quiz.id]))
+        self.assertEqual(response.json(), {'id': quiz.id, 'html': quiz.description_html})
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        caches['fragments'].clear()
+        self.student = make_student('student1')
+        self.quiz = make_quiz(make_course(1), 1)
+        self.submission = make_submission(self.student, self.quiz)
+        self.client.force_login(self.student)
+
+    def assertCachedRender(self, url):
+        # The second hit is served from the fragment cache with fewer queries
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(url)
+        self.assertLess(len(second), len(first))
+        return response
+
+    def test_pages_are_served_from_cache(self):
+        for url in [reverse('dashboard'), reverse('courses'), reverse('quizzes', args=[self.quiz.course.id]), reverse('view_overall_rank')]:
+            self.assertCachedRender(url)
+
+    def test_writes_invalidate_dashboard(self):
+        url = reverse('dashboard')
+        self.assertCachedRender(url)
+        self.submission.marks = 7
+        self.submission.save()
+        self.assertContains(self.client.get(url), '7 Points')
+        make_quiz(make_course(2), 2)
+        self.assertContains(self.client.get(url), 'Course 2')
+
+    def test_moving_a_quiz_invalidates_both_courses(self):
+        other = make_course(2)
+        old_url, new_url = reverse('quizzes', args=[self.quiz.course.id]), reverse('quizzes', args=[other.id])
+        self.assertCachedRender(old_url)
+        self.assertCachedRender(new_url)
+        quiz = Quiz.objects.get(id=self.quiz.id)
+        quiz.course = other
+        quiz.save()
+        self.assertNotContains(self.client.get(old_url), 'Quiz 1')
+        self.assertContains(self.client.get(new_url), 'Quiz 1')
+
+    def test_sessions_are_read_from_cache(self):
+        self.client.get(reverse('courses'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('courses'))
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+
+    def test_rankings_fragment_is_keyed_on_the_resolved_page(self):
+        url = reverse('view_overall_rank')
+        self.assertCachedRender(url)
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(url)
+        for page in ['1', 'abc', '999', '-5']:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url, {'page': page})
+            self.assertEqual(len(queries), len(cached))
+
+    def test_bulk_grading_invalidates_rankings(self):
+        url = reverse('view_overall_rank')
+        self.assertCachedRender(url)
+        bulk_grade(self.quiz, {self.submission.id: (9, None)})
+        self.assertContains(self.client.get(url), '#1 &middot; 9 /')
+
+    def test_only_leaderboard_changes_bump_rankings(self):
+        self.student.set_password('secret')
+        self.student.save()
+        other = make_student('student2')
+        version = get_versions('rankings')
+        self.assertTrue(self.client.login(username='student1', password='secret'))
+        make_submission(other, self.quiz)
+        StudentProfile.objects.filter(user=self.student).get().save()
+        self.student.email = 'student1@example.com'
+        self.student.save()
+        self.assertEqual(get_versions('rankings'), version)
+        self.submission.marks = 4
+        self.submission.save()
+        self.assertNotEqual(get_versions('rankings'), version)
+        version = get_versions('rankings')
+        self.student.first_name = 'Ada'
+        self.student.save()
+        self.assertNotEqual(get_versions('rankings'), version)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        self.student = make_student('student1')
+        self.quiz = make_quiz(make_course(1), 1)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn('INDEX', plan)
+        self.assertIn(index, plan)
+
+    def test_hot_filters_use_indexes(self):
+        course = self.quiz.course
+        # SQLite names the index of an inline UNIQUE constraint itself
+        self.assertUsesIndex(Submission.objects.filter(student=self.student, quiz=self.quiz), '(student_id=? AND quiz_id=?)')
+        self.assertUsesIndex(Submission.objects.filter(student=self.student, course=course), 'submission_student_course_idx')
+        self.assertUsesIndex(
+            Submission.objects.filter(student=self.student).values('course_id').annotate(n=Count('id')).order_by(),
+            'COVERING INDEX submission_student_course_idx',
+        )
+        self.assertUsesIndex(Submission.objects.filter(course=course).order_by('-submitted_at', '-id'), 'submission_course_recent_idx')
+        self.assertUsesIndex(Quiz.objects.filter(course=course, due_date__lte=timezone.now()), 'quiz_course_due_idx')
+        self.assertUsesIndex(StudentComplaints.objects.order_by('-submitted_at'), 'submitted_at')
+        self.assertUsesIndex(
+            StudentComplaints.objects.filter(student=self.student).order_by('-submitted_at', '-id'), 'complaint_student_recent_idx',
+        )
+        # The API's ETag aggregates
+        self.assertUsesIndex(Quiz.objects.filter(course=course).order_by('updated'), 'quiz_course_updated_idx')
+        self.assertUsesIndex(Submission.objects.filter(student=self.student).order_by('updated'), 'submission_student_updated_idx')
+
+    def test_duplicate_submissions_are_rejected(self):
+        make_submission(self.student, self.quiz)
+        with self.assertRaises(IntegrityError):
+            make_submission(self.student, self.quiz)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.students = [make_student(f'student{i}') for i in range(3)]
+        course = make_course(1)
+        self.quiz = make_quiz(course, 1)
+        self.submissions = [make_submission(student, self.quiz) for student in self.students]
+
+    def grade(self, submission, marks):
+        self.client.force_login(self.staff)
+        self.client.post(reverse('grade_submission', args=[submission.id]), {'marks': marks})
+
+    def test_grading_updates_ranking_incrementally(self):
+        self.grade(self.submissions[1], 7)
+        self.grade(self.submissions[2], 4)
+        self.grade(self.submissions[2], 9)
+        self.assertEqual(get_user_rank(self.students[2]).rank, 1)
+        self.assertEqual(get_user_rank(self.students[1]).rank, 2)
+        ranking = StudentRanking.objects.get(user=self.students[2])
+        self.assertEqual((ranking.total_marks, ranking.graded_count), (9, 1))
+
+    def test_marks_saved_outside_the_view_update_ranking(self):
+        # Admin and shell edits, and submissions created with marks
+        submission = Submission.objects.get(id=self.submissions[0].id)
+        submission.marks = 8
+        submission.save()
+        make_submission(self.students[0], make_quiz(self.quiz.course, 2), marks=3)
+        self.grade(self.submissions[0], 5)
+        deferred = Submission.objects.only('id', 'student_id').get(id=self.submissions[0].id)
+        deferred.marks = 6
+        deferred.save()
+        ranking = StudentRanking.objects.get(user=self.students[0])
+        self.assertEqual((ranking.total_marks, ranking.graded_count), (9, 2))
+        self.assertFalse(StudentRanking.objects.filter(total_marks__lt=0).exists())
+
+    def test_deleting_submission_removes_marks(self):
+        self.grade(self.submissions[0], 6)
+        Submission.objects.get(id=self.submissions[0].id).delete()
+        ranking = StudentRanking.objects.get(user=self.students[0])
+        self.assertEqual((ranking.total_marks, ranking.graded_count), (0, 0))
+
+    def test_rebuild_matches_incremental_state(self):
+        self.grade(self.submissions[0], 5)
+        self.grade(self.submissions[1], 8)
+        before = list(StudentRanking.objects.order_by('user_id').values_list('user_id', 'total_marks', 'graded_count'))
+        rebuild_rankings()
+        after = list(StudentRanking.objects.order_by('user_id').values_list('user_id', 'total_marks', 'graded_count'))
+        self.assertEqual(before, after)
+
+    def test_rankings_page_numbers_rows(self):
+        self.grade(self.submissions[0], 5)
+        page = get_rankings_page(2, per_page=2)
+        self.assertEqual([entry.rank for entry in page], [3, 4])
+        self.assertEqual(get_rankings_page(1, per_page=2)[0].user_id, self.students[0].id)
+
+    def test_rank_lookup_query_count(self):
+        with self.assertNumQueries(2):
+            get_user_rank(self.students[0])
+
+    def test_overall_rank_view(self):
+        self.client.force_login(self.students[0])
+        response = self.client.get(reverse('view_overall_rank'), {'page': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['current_user_rank'].user_id, self.students[0].id)
+
+
+class QuizRosterTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.quiz = make_quiz(make_course(1), 1)
+        self.students = [make_student(f'student{i}') for i in range(4)]
+        make_submission(self.students[0], self.quiz, marks=3)
+        make_submission(self.students[1], self.quiz, marks=8)
+        make_submission(self.students[2], self.quiz)
+
+    def usernames(self, **kwargs):
+        return [user.username for user in quiz_roster_queryset(self.quiz, **kwargs)]
+
+    def test_roster_excludes_staff_and_filters(self):
+        self.assertEqual(self.usernames(), ['student0', 'student1', 'student2', 'student3'])
+        self.assertEqual(self.usernames(status='submitted'), ['student0', 'student1', 'student2'])
+        self.assertEqual(self.usernames(status='ungraded'), ['student2'])
+        self.assertEqual(self.usernames(status='not_submitted'), ['student3'])
+
+    def test_roster_sorts_by_marks_with_missing_last(self):
+        self.assertEqual(self.usernames(sort='-marks'), ['student1', 'student0', 'student2', 'student3'])
+
+    def test_view_query_count_does_not_grow_with_students(self):
+        self.client.force_login(self.staff)
+        url = reverse('view_quiz_submissions', args=[self.quiz.id])
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for i in range(4, 20):
+            make_submission(make_student(f'student{i}'), self.quiz)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {'sort': '-submitted_at', 'status': 'ungraded'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(response.context['counts'], {'submitted': 19, 'graded': 2})
+
+
+class SubmissionListingTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.course = make_course(1)
+        self.quizzes = [make_quiz(self.course, i) for i in range(2)]
+        self.submissions = [
+            make_submission(make_student(f'student{i}'), self.quizzes[i % 2], marks=i if i % 3 else None)
+            for i in range(7)
+        ]
+
+    def test_keyset_pages_cover_every_row_once(self):
+        listing = submission_listing(course=self.course)
+        seen, cursor, pages = [], None, []
+        while True:
+            page = get_submission_page(listing, after=cursor, per_page=3)
+            pages.append(page)
+            seen += [submission.id for submission in page['submissions']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        expected = list(listing.order_by('-submitted_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        back = get_submission_page(listing, before=pages[-1]['prev_cursor'], per_page=3)
+        self.assertEqual(back['submissions'], pages[-2]['submissions'])
+
+    def test_filters(self):
+        self.assertEqual(submission_listing(course=self.course, quiz_id=self.quizzes[0].id).count(), 4)
+        self.assertEqual(submission_listing(course=self.course, status='ungraded').count(), 3)
+        today = timezone.localdate().isoformat()
+        self.assertEqual(submission_listing(course=self.course, date_from=today, date_to=today).count(), 7)
+
+    def test_view_renders_rows_in_one_query(self):
+        self.client.force_login(self.staff)
+        url = reverse('view_submissions', args=[self.course.id])
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        make_submission(make_student('student8'), self.quizzes[1])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {'status': 'ungraded'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+
+class ComplaintInboxTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.students = [make_student(f'student{i}') for i in range(2)]
+        self.complaints = [
+            StudentComplaints.objects.create(student=self.students[i % 2], complaint=f'<p>Issue <b>{i}</b> &amp; more</p>')
+            for i in range(5)
+        ]
+
+    def test_preview_is_plain_text(self):
+        self.assertEqual(self.complaints[0].preview, 'Issue 0 & more')
+        complaint = self.complaints[0]
+        complaint.complaint = '<p>' + 'word ' * 100 + '</p>'
+        complaint.save()
+        complaint.refresh_from_db()
+        self.assertEqual(len(complaint.preview), 200)
+        self.assertTrue(complaint.preview.endswith('…'))
+
+    def test_keyset_pages_and_filters(self):
+        listing = complaint_listing()
+        first = get_complaint_page(listing, per_page=3)
+        second = get_complaint_page(listing, after=first['next_cursor'], per_page=3)
+        self.assertEqual(
+            [complaint.id for complaint in first['complaints'] + second['complaints']],
+            [complaint.id for complaint in reversed(self.complaints)],
+        )
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(complaint_listing(student='student1').count(), 2)
+        today = timezone.localdate()
+        self.assertEqual(complaint_listing(date_from=today.isoformat()).count(), 5)
+        self.assertEqual(complaint_listing(date_to=(today - timedelta(days=1)).isoformat()).count(), 0)
+
+    def test_inbox_shows_previews_and_detail_shows_full_text(self):
+        self.client.force_login(self.staff)
+        url = reverse('view_complaints')
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertContains(response, 'Issue 4 &amp; more')
+        self.assertNotContains(response, '<b>4</b>')
+        StudentComplaints.objects.create(student=make_student('student9'), complaint='<p>Late</p>')
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url, {'student': 'student9'})
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(any('"base_studentcomplaints"."complaint"' in query['sql'] for query in large))
+
+        response = self.client.get(reverse('view_complaint', args=[self.complaints[4].id]))
+        self.assertContains(response, '<b>4</b>')
+        self.client.force_login(self.students[0])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_detail_shows_sanitized_html(self):
+        complaint = StudentComplaints.objects.create(
+            student=self.students[0], complaint='<p onclick="steal()">Help <script>steal()</script><i>now</i></p>',
+        )
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('view_complaint', args=[complaint.id]))
+        self.assertContains(response, '<p>Help <i>now</i></p>')
+        self.assertNotContains(response, 'steal()')
+
+
+class BulkGradingTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.quiz = make_quiz(make_course(1), 1)
+        self.other_quiz = make_quiz(self.quiz.course, 2)
+        self.students = [make_student(f'student{i}') for i in range(4)]
+        self.submissions = [make_submission(student, self.quiz) for student in self.students]
+        self.foreign = make_submission(self.students[0], self.other_quiz)
+        self.client.force_login(self.staff)
+
+    def test_bulk_grade_writes_valid_rows_and_reports_errors(self):
+        data = {
+            f'marks_{self.submissions[0].id}': '7',
+            f'remarks_{self.submissions[0].id}': 'Well done',
+            f'marks_{self.submissions[1].id}': '11',
+            f'marks_{self.submissions[2].id}': '4',
+            f'marks_{self.foreign.id}': '5',
+            f'marks_{self.submissions[3].id}': '',
+            f'remarks_{self.submissions[3].id}': 'Needs marks',
+        }
+        response = self.client.post(reverse('bulk_grade', args=[self.quiz.id]), data, follow=True)
+        errors = [str(m) for m in response.context['messages'] if m.level_tag == 'error']
+        self.assertEqual(len(errors), 3)
+        self.assertIn(f'{self.students[3].username}: Remarks are only saved together with marks, row skipped', errors)
+        self.assertIsNone(Submission.objects.get(id=self.submissions[3].id).remarks)
+        marks = dict(Submission.objects.values_list('id', 'marks'))
+        self.assertEqual(marks[self.submissions[0].id], 7)
+        self.assertIsNone(marks[self.submissions[1].id])
+        self.assertEqual(marks[self.submissions[2].id], 4)
+        self.assertIsNone(marks[self.foreign.id])
+        self.assertEqual(Submission.objects.get(id=self.submissions[0].id).remarks, 'Well done')
+        self.assertEqual(StudentRanking.objects.get(user=self.students[0]).total_marks, 7)
+        self.assertEqual(get_user_rank(self.students[2]).rank, 2)
+
+    def test_bulk_grade_query_count_is_constant(self):
+        url = reverse('bulk_grade', args=[self.quiz.id])
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, {f'marks_{self.submissions[0].id}': '1'})
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(url, {f'marks_{submission.id}': '2' for submission in self.submissions})
+        self.assertEqual(len(small), len(large))
+
+
+class GradebookTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.course = make_course(1)
+        self.quizzes = [make_quiz(self.course, i) for i in range(2)]
+        self.students = [make_student(f'student{i}') for i in range(3)]
+        self.submission = make_submission(self.students[0], self.quizzes[0], marks=6)
+        self.pending = make_submission(self.students[1], self.quizzes[1])
+        self.client.force_login(self.staff)
+
+    def export(self):
+        response = self.client.get(reverse('export_gradebook', args=[self.course.id]))
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_matrix(self):
+        self.assertEqual(self.export(), [
+            'Registration No,First Name,Last Name,Q-0,Q-1,Total',
+            'student0,,,6,,6',
+            'student1,,,,,0',
+            'student2,,,,,0',
+        ])
+
+    def test_export_escapes_formulas(self):
+        User.objects.filter(id=self.students[0].id).update(
+            username='-student0', first_name='=HYPERLINK("http://example.com")', last_name='@SUM(A1)',
+        )
+        self.assertEqual(self.export()[1], '\'-student0,"\'=HYPERLINK(""http://example.com"")",\'@SUM(A1),6,,6')
+        # The escaped username still imports
+        rows = self.export()
+        rows[1] = rows[1].replace(',6,,6', ',8,,8')
+        upload = SimpleUploadedFile('grades.csv', '\n'.join(rows[:2]).encode(), content_type='text/csv')
+        self.client.post(reverse('import_gradebook', args=[self.course.id]), {'file': upload})
+        self.assertEqual(Submission.objects.get(id=self.submission.id).marks, 8)
+
+    def test_import_round_trip(self):
+        rows = self.export()
+        rows[1] = 'student0,,,9,,9'
+        rows[2] = 'student1,,,,4,4'
+        rows[3] = 'student2,,,5,,5'
+        upload = SimpleUploadedFile('grades.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        response = self.client.post(reverse('import_gradebook', args=[self.course.id]), {'file': upload}, follow=True)
+        errors = [str(m) for m in response.context['messages'] if m.level_tag == 'error']
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Submission.objects.get(id=self.submission.id).marks, 9)
+        self.assertEqual(Submission.objects.get(id=self.pending.id).marks, 4)
+        self.assertEqual(StudentRanking.objects.get(user=self.students[1]).total_marks, 4)
+        # None of the students has an email address
+        self.assertFalse(Job.objects.exists())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @task(name='tests.flaky', max_attempts=2)
+        def flaky(fail):
+            self.calls.append(fail)
+            if fail:
+                raise RuntimeError('boom')
+        self.addCleanup(TASKS.pop, 'tests.flaky')
+        self.flaky = flaky
+
+    def test_job_runs_once(self):
+        job = self.flaky.enqueue(fail=False)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(run_pending_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertEqual(self.calls, [False])
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        job = self.flaky.enqueue(fail=True)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        # Not due yet
+        self.assertEqual(run_pending_jobs(), 0)
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.calls, [True, True])
+
+    def test_unknown_task_fails_without_retry(self):
+        job = enqueue('tests.missing')
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('Unknown task', job.last_error)
+
+    def test_claims_are_exclusive(self):
+        job = self.flaky.enqueue(fail=False)
+        claimed = claim_job('worker-1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertIsNone(claim_job('worker-2'))
+        run_job(claimed)
+        self.assertEqual(Job.objects.get(id=job.id).worker, 'worker-1')
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_jobs_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flaky.enqueue(fail=False)
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [False])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_jobs_purge_old_finished_jobs(self):
+        old = self.flaky.enqueue(fail=False, delay=timedelta(days=1))
+        Job.objects.filter(id=old.id).update(status=Job.DONE, updated=timezone.now() - timedelta(days=30))
+        with mock.patch('base.jobs.last_housekeeping', None), self.captureOnCommitCallbacks(execute=True):
+            job = self.flaky.enqueue(fail=False)
+        self.assertEqual(list(Job.objects.values_list('id', flat=True)), [job.id])
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.quiz = make_quiz(make_course(1), 1)
+        self.student = make_student('student1', email='student1@example.com')
+        self.submission = make_submission(self.student, self.quiz)
+        self.client.force_login(self.staff)
+
+    def test_grading_sends_email_from_the_worker(self):
+        self.client.post(reverse('grade_submission', args=[self.submission.id]), {'marks': '8'})
+        self.assertEqual(mail.outbox, [])
+        run_pending_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['student1@example.com'])
+        self.assertIn('8 marks', mail.outbox[0].body)
+
+    def test_no_jobs_for_students_without_email(self):
+        other = make_submission(make_student('student2'), self.quiz)
+        self.client.post(reverse('grade_submission', args=[other.id]), {'marks': '8'})
+        self.assertFalse(Job.objects.exists())
+
+    def test_submission_receipt(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        overrides = override_settings(MEDIA_ROOT=tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.student)
+        upload = SimpleUploadedFile('answer.txt', b'answer')
+        self.client.post(reverse('submit_quiz', args=[self.quiz.id]), {'file': upload})
+        run_pending_jobs()
+        self.assertEqual([message.subject for message in mail.outbox], ['Submission received: Quiz 1'])
+
+    def test_announcement_fans_out_in_batches(self):
+        for i in range(4):
+            make_student(f'other{i}', email=f'other{i}@example.com')
+        make_student('no_email')
+        with mock.patch('base.notifications.ANNOUNCEMENT_BATCH_SIZE', 2):
+            announce_quiz.enqueue(quiz_id=self.quiz.id)
+            run_pending_jobs()
+        self.assertEqual(Job.objects.filter(task='base.notifications.send_quiz_announcement').count(), 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertNotIn('staff1', ''.join(message.body for message in mail.outbox))
+
+
+class DeviceDetectionTests(TestCase):
+    CHROME = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+    def setUp(self):
+        self.student = make_student('student1')
+        self.student.set_password('pass')
+        self.student.save()
+        parse_user_agent.cache_clear()
+        self.addCleanup(parse_user_agent.cache_clear)
+
+    def login(self, **headers):
+        return self.client.post(reverse('login'), {'reg_no': 'student1', 'password': 'pass'}, headers=headers)
+
+    def test_user_agent_is_parsed_once_per_session(self):
+        self.login(user_agent=self.CHROME)
+        with mock.patch('base.devices.httpagentparser.detect', wraps=httpagentparser.detect) as detect:
+            parse_user_agent.cache_clear()
+            for _ in range(3):
+                response = self.client.get(reverse('dashboard'), headers={'user-agent': self.CHROME})
+                self.assertEqual(response.context['device']['platform'], 'Windows')
+            self.assertEqual(detect.call_count, 1)
+            # A different browser on the same session is parsed again
+            response = self.client.get(reverse('dashboard'), headers={'user-agent': 'curl/8.0'})
+            self.assertEqual(response.context['device']['platform'], 'Unknown Device')
+            self.assertEqual(detect.call_count, 2)
+
+    def test_logins_are_recorded_per_device(self):
+        self.login(user_agent=self.CHROME)
+        self.client.logout()
+        self.login(user_agent=self.CHROME)
+        self.client.logout()
+        self.login(user_agent='curl/8.0')
+        devices = {device.browser: device for device in LoginDevice.objects.filter(user=self.student)}
+        self.assertEqual(set(devices), {'Chrome 120.0', ''})
+        self.assertEqual(devices['Chrome 120.0'].login_count, 2)
+        self.assertEqual(devices['Chrome 120.0'].platform, 'Windows')
+        response = self.client.get(reverse('settings'))
+        self.assertContains(response, 'Chrome 120.0 on Windows')
+
+
+class InstrumentationTests(QueryBudgetMixin, TestCase):
+    # Budgets for cold fragment caches, with enough rows that a per-row
+    # query would exceed them
+    VIEW_BUDGETS = [
+        ('dashboard', [], 'student', 4),
+        ('courses', [], 'student', 3),
+        ('quizzes', ['course'], 'student', 6),
+        ('view_overall_rank', [], 'student', 7),
+        ('view_submissions', ['course'], 'staff', 6),
+        ('view_quiz_submissions', ['quiz'], 'staff', 6),
+        ('metrics', [], 'staff', 1),
+    ]
+
+    def setUp(self):
+        caches['fragments'].clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.staff = make_student('staff1', is_staff=True)
+        self.course = make_course(1)
+        self.quizzes = [make_quiz(self.course, i) for i in range(4)]
+        self.students = [make_student(f'student{i}') for i in range(5)]
+        for student in self.students:
+            for quiz in self.quizzes[:3]:
+                make_submission(student, quiz)
+        self.quiz = self.quizzes[0]
+        self.student = self.students[0]
+
+    def test_view_query_budgets(self):
+        for name, args, role, budget in self.VIEW_BUDGETS:
+            with self.subTest(view=name):
+                self.client.force_login(self.staff if role == 'staff' else self.student)
+                url = reverse(name, args=[getattr(self, arg).id for arg in args])
+                with self.assertQueryBudget(budget):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        self.client.force_login(self.student)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+$')
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        self.assertNotEqual(header.rsplit('tpl;dur=', 1)[1], '0.0')
+
+    def test_metrics_endpoint(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics'), headers={'authorization': 'Bearer wrong'}).status_code, 403)
+            response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer secret'})
+        body = response.content.decode()
+        self.assertIn('studybud_requests_total{view="dashboard",method="GET",status="200"} 2', body)
+        self.assertIn('studybud_request_duration_seconds_count{view="dashboard"} 2', body)
+        self.assertRegex(body, r'studybud_db_queries_total\{view="dashboard"\} [1-9]')
+
+
+class APITests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.student = make_student('student1')
+        self.other = make_student('student2')
+        self.course = make_course(1)
+        self.quizzes = [make_quiz(self.course, i) for i in range(3)]
+        self.submissions = [make_submission(self.student, quiz) for quiz in self.quizzes]
+        self.client.force_login(self.student)
+
+    def get(self, name, *args, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse(name, args=args), headers=headers)
+
+    def assertChanged(self, name, *args, etag):
+        response = self.get(name, *args, etag=etag)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.get('api_courses')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post(reverse('api_courses')).status_code, 401)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.post(reverse('api_courses')).status_code, 405)
+
+    def test_unchanged_collection_is_a_single_query_304(self):
+        for name, args in [
+            ('api_courses', []), ('api_quizzes', [self.course.id]), ('api_submissions', []), ('api_ranking', []),
+        ]:
+            with self.subTest(view=name):
+                response = self.get(name, *args)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('W/"'))
+                self.assertIn('no-cache', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.get(name, *args, etag=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(len([query for query in queries if 'auth_user' not in query['sql']]), 1)
+
+    def test_etags_follow_edits_and_deletions(self):
+        etag = self.get('api_quizzes', self.course.id)['ETag']
+        self.quizzes[0].quiz_title = 'Renamed'
+        self.quizzes[0].save()
+        etag = self.assertChanged('api_quizzes', self.course.id, etag=etag)
+        self.quizzes[1].delete()
+        etag = self.assertChanged('api_quizzes', self.course.id, etag=etag)
+        make_quiz(make_course(2), 9)
+        self.assertEqual(self.get('api_quizzes', self.course.id, etag=etag).status_code, 304)
+
+        etag = self.get('api_submissions')['ETag']
+        bulk_grade(self.quizzes[2], {self.submissions[2].id: (6, None)})
+        response = self.get('api_submissions', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['marks'] for row in response.json()['submissions'] if row['id'] == self.submissions[2].id], [6])
+        # The submissions carry their quiz's title
+        etag = response['ETag']
+        self.quizzes[2].quiz_title = 'Renamed again'
+        self.quizzes[2].save()
+        response = self.get('api_submissions', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed again', [row['quiz']['title'] for row in response.json()['submissions']])
+
+        # Another student's grade moves this student's rank
+        etag = self.get('api_ranking')['ETag']
+        bulk_grade(self.quizzes[2], {make_submission(self.other, self.quizzes[2]).id: (9, None)})
+        response = self.get('api_ranking', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ranking']['rank'], 2)
+
+    def test_listings_do_not_grow_with_rows(self):
+        names = [('api_quizzes', [self.course.id]), ('api_submissions', [])]
+        small = {}
+        for name, args in names:
+            with CaptureQueriesContext(connection) as small[name]:
+                self.get(name, *args)
+        for i in range(10, 20):
+            make_submission(self.student, make_quiz(self.course, i))
+        for name, args in names:
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as large:
+                    response = self.get(name, *args)
+                self.assertEqual(len(small[name]), len(large))
+        self.assertEqual(len(response.json()['submissions']), 13)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.staff = make_student('staff1', is_staff=True)
+        self.student = make_student('student1')
+        self.quiz = make_quiz(make_course(1), 1)
+        self.quiz.description = '<p>Dynamic&nbsp;<strong>programming</strong></p><p>Memoization</p>'
+        self.quiz.save()
+        self.client.force_login(self.staff)
+
+    def titles(self, query, kinds=None):
+        return [document.title for document in SearchResults(query, kinds)[:20]]
+
+    def test_html_is_stripped_at_write_time(self):
+        self.assertEqual(html_to_text('<p>a&amp;b</p><p>c<br>d</p>'), 'a&b c d')
+        document = SearchDocument.objects.get(kind=SearchDocument.QUIZ, object_id=self.quiz.id)
+        self.assertEqual(document.body, 'Dynamic programming Memoization')
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.titles('memoiz'), ['Q-1 Quiz 1'])
+        self.quiz.description = '<p>Greedy algorithms</p>'
+        self.quiz.save()
+        self.assertEqual(self.titles('memoization'), [])
+        self.assertEqual(self.titles('greedy algorithm'), ['Q-1 Quiz 1'])
+
+        submission = make_submission(self.student, self.quiz)
+        submission.remarks = '<p>Check the <em>base case</em></p>'
+        submission.save()
+        self.assertEqual(self.titles('base case', kinds=[SearchDocument.REMARKS]), ['Quiz 1: remarks for student1'])
+        submission.remarks = ''
+        submission.save()
+        self.assertEqual(self.titles('base case'), [])
+
+        complaint = StudentComplaints.objects.create(student=self.student, complaint='<p>Portal <b>timeout</b></p>')
+        self.assertEqual(self.titles('timeout'), ['Complaint from student1'])
+        complaint.delete()
+        self.assertEqual(self.titles('timeout'), [])
+
+    def test_bulk_grade_indexes_remarks(self):
+        submission = make_submission(self.student, self.quiz)
+        bulk_grade(self.quiz, {submission.id: (7, '<p>Nice recursion</p>')})
+        self.assertEqual(self.titles('recursion'), ['Quiz 1: remarks for student1'])
+
+    def test_search_view_ranks_and_paginates(self):
+        for i in range(25):
+            StudentComplaints.objects.create(student=self.student, complaint=f'<p>Wifi issue number {i}</p>')
+        StudentComplaints.objects.create(student=self.student, complaint='<p>Quiz <i>deadline</i> & <script>x</script></p>')
+        response = self.client.get(reverse('search'), {'q': 'wifi', 'page': 2})
+        self.assertEqual(response.context['results'].paginator.count, 25)
+        self.assertEqual(len(response.context['results'].object_list), 5)
+        self.assertContains(response, '<mark>Wifi</mark>')
+
+        response = self.client.get(reverse('search'), {'q': 'deadline', 'kind': 'complaint'})
+        self.assertEqual([document.title for document in response.context['results']], ['Complaint from student1'])
+        self.assertContains(response, 'Quiz <mark>deadline</mark> &amp;')
+        self.assertNotContains(response, '&amp; x')
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'deadline', 'kind': 'quiz'}).context['results'].paginator.count, 0)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'wifi'}).status_code, 302)
+
+
+class BenchmarkDataTests(TestCase):
+    def snapshot(self):
+        return list(Submission.objects.order_by('quiz__quiz_no', 'student__username').values_list(
+            'quiz__quiz_no', 'student__username', 'marks',
+        ))
+
+    def test_generated_data_is_reproducible(self):
+        counts = generate_data(students=30, courses=2, quizzes=6, skew=1.5, seed=7)
+        first = self.snapshot()
+        self.assertEqual(len(first), counts['submissions'])
+        # Skewed: the busiest student submits more than the median one
+        per_student = sorted(Submission.objects.values('student').annotate(n=Count('id')).values_list('n', flat=True))
+        self.assertGreater(per_student[-1], per_student[len(per_student) // 2])
+        remove_data()
+        self.assertFalse(Submission.objects.exists())
+        generate_data(students=30, courses=2, quizzes=6, skew=1.5, seed=7)
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(StudentRanking.objects.filter(user__username__startswith='bench-').count(), 31)
+
+    def test_compare_reports_regressions(self):
+        def result(queries, p95, peak):
+            return {'queries': queries, 'p95_ms': p95, 'peak_kb': peak, 'threaded': {'p95_ms': p95}}
+        baseline = {'views': {'dashboard': result(4, 10, 100), 'quizzes': result(6, 10, 100)}}
+        current = {'views': {'dashboard': result(5, 12, 100), 'quizzes': result(6, 20, 100)}}
+        self.assertEqual(compare(baseline, current, tolerance=0.25), [
+            'dashboard: 4 -> 5 queries',
+            'quizzes: p95 10 -> 20 ms',
+            'quizzes: threaded p95 10 -> 20 ms',
+        ])
+
+
+class BulkRegistrationTests(TestCase):
+    CSV = (
+        'reg_no,password,first_name,last_name,gender,role\n'
+        '1001,secret123,Ali,Khan,male,\n'
+        '1002,secret123,Sara,Ahmed,Female,staff\n'
+        '1001,secret123,Dup,Row,Male,student\n'
+        'taken,secret123,Old,User,Male,student\n'
+        '1003,,No,Password,Male,student\n'
+        '1004,secret123,Bad,Role,Male,admin\n'
+    )
+
+    def setUp(self):
+        self.staff = make_student('taken', is_staff=True)
+
+    def test_bulk_register_reports_per_row_failures(self):
+        upload = SimpleUploadedFile('users.csv', self.CSV.encode(), content_type='text/csv')
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('bulk_register_students'), {'file': upload})
+        self.assertEqual(response.context['created'], 2)
+        self.assertEqual([line for line, _ in response.context['errors']], [4, 5, 6, 7])
+        staff = User.objects.get(username='1002')
+        self.assertTrue(staff.is_staff)
+        self.assertTrue(staff.check_password('secret123'))
+        self.assertEqual(staff.studentprofile.gender, 'Female')
+        self.assertEqual(User.objects.get(username='1001').studentprofile.gender, 'Male')
+        self.assertTrue(StudentRanking.objects.filter(user=staff).exists())
+
+    def test_registration_taken_after_validation_is_reported(self):
+        def validate_then_register(rows):
+            result = validate_rows(rows)
+            make_student('1002')
+            return result
+        upload = SimpleUploadedFile('users.csv', self.CSV.encode(), content_type='text/csv')
+        self.client.force_login(self.staff)
+        with mock.patch('base.registration.validate_rows', side_effect=validate_then_register), \
+                mock.patch('base.registration.hash_passwords', wraps=hash_passwords) as hashing:
+            response = self.client.post(reverse('bulk_register_students'), {'file': upload})
+        self.assertEqual(hashing.call_args.kwargs['workers'], 1)
+        self.assertEqual(response.context['created'], 1)
+        self.assertIn((3, 'Registration number 1002 already exists'), response.context['errors'])
+        self.assertTrue(User.objects.filter(username='1001').exists())
+
+
+class ChunkedUploadTests(TestCase):
+    CONTENT = b'%PDF-1.4 chunked upload body'
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            MEDIA_ROOT=self.tmp, CHUNKED_UPLOAD_DIR=f'{self.tmp}/parts', SUBMISSION_CHUNK_SIZE=8,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.student = make_student('student1')
+        self.quiz = make_quiz(make_course(1), 1)
+        self.client.force_login(self.student)
+
+    def start(self, filename='answer.pdf', size=None):
+        return self.client.post(reverse('start_chunked_upload', args=[self.quiz.id]), {
+            'filename': filename, 'size': len(self.CONTENT) if size is None else size,
+        })
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('upload_chunk', args=[upload_id]), data,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def test_upload_resume_and_complete(self):
+        upload_id = self.start().json()['upload_id']
+        self.assertEqual(self.put(upload_id, 0, self.CONTENT[:8]).json()['received'], 8)
+        # A retried chunk at a stale offset is refused with the current size
+        response = self.put(upload_id, 0, self.CONTENT[:8])
+        self.assertEqual((response.status_code, response.json()['received']), (409, 8))
+        # Starting again with the same file resumes the existing upload
+        self.assertEqual(self.start().json(), {'upload_id': upload_id, 'received': 8, 'chunk_size': 8})
+        offset = 8
+        while offset < len(self.CONTENT):
+            offset = self.put(upload_id, offset, self.CONTENT[offset:offset + 8]).json()['received']
+        response = self.client.post(reverse('complete_chunked_upload', args=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+        submission = Submission.objects.get(student=self.student, quiz=self.quiz)
+        with submission.file.open('rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_rejects_bad_type_size_and_content(self):
+        self.assertEqual(self.start(filename='answer.exe').status_code, 400)
+        with self.settings(SUBMISSION_MAX_SIZE=10):
+            self.assertEqual(self.start().status_code, 400)
+        upload_id = self.start(filename='notes.pdf', size=8).json()['upload_id']
+        self.assertEqual(self.put(upload_id, 0, b'PK\x03\x04abcd').status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_incomplete_upload_cannot_be_committed(self):
+        upload_id = self.start().json()['upload_id']
+        self.put(upload_id, 0, self.CONTENT[:8])
+        response = self.client.post(reverse('complete_chunked_upload', args=[upload_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Submission.objects.exists())
+
+    def test_upload_cannot_be_committed_after_the_deadline(self):
+        upload_id = self.start().json()['upload_id']
+        for offset in range(0, len(self.CONTENT), 8):
+            self.put(upload_id, offset, self.CONTENT[offset:offset + 8])
+        Quiz.objects.filter(id=self.quiz.id).update(due_date=timezone.now() - timedelta(minutes=1))
+        response = self.client.post(reverse('complete_chunked_upload', args=[upload_id]))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['error'], 'Quiz submission deadline has passed')
+        self.assertFalse(Submission.objects.exists())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(MEDIA_ROOT=self.tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.quiz = make_quiz(make_course(1), 1)
+        self.students = [make_student(f'student{i}') for i in range(2)]
+
+    def submit(self, student, content):
+        self.client.force_login(student)
+        upload = SimpleUploadedFile('answer.txt', content, content_type='text/plain')
+        self.client.post(reverse('submit_quiz', args=[self.quiz.id]), {'file': upload})
+        return Submission.objects.get(student=student, quiz=self.quiz)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.submit(self.students[0], b'same bytes')
+        second = self.submit(self.students[1], b'same bytes')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith('blobs/'))
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(first.file.storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            Submission.objects.get(id=second.id).delete()
+        self.assertFalse(second.file.storage.exists(second.file.name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_resubmission_releases_previous_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            old = self.submit(self.students[0], b'first draft').file.name
+            new = self.submit(self.students[0], b'final answer').file.name
+        self.assertNotEqual(old, new)
+        self.assertEqual(list(StoredBlob.objects.values_list('name', 'ref_count')), [(new, 1)])
+        storage = Submission._meta.get_field('file').storage
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(storage.exists(new))
+
+    def test_reuse_keeps_a_released_blob(self):
+        first = self.submit(self.students[0], b'same bytes')
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # The same content is uploaded again before the delete runs
+        second = self.submit(self.students[1], b'same bytes')
+        for callback in callbacks:
+            callback()
+        self.assertTrue(second.file.storage.exists(second.file.name))
+        self.assertEqual(StoredBlob.objects.get(name=second.file.name).ref_count, 1)
+
+    def test_moves_temporary_files_across_filesystems(self):
+        storage = Submission._meta.get_field('file').storage
+        upload = TemporaryUploadedFile('answer.txt', 'text/plain', 10, None)
+        upload.write(b'large file')
+        upload.flush()
+        # Neither can move a file to another filesystem
+        cross_device = OSError(errno.EXDEV, 'Invalid cross-device link')
+        with mock.patch('os.rename', side_effect=cross_device), mock.patch('os.replace', side_effect=cross_device):
+            name = storage.save('answer.txt', upload)
+        upload.close()
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), b'large file')
+
+
+class ProtectedDownloadTests(TestCase):
+    CONTENT = b'0123456789abcdef'
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(MEDIA_ROOT=self.tmp, PROTECTED_MEDIA_SERVER='')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.quiz = make_quiz(make_course(1), 1)
+        self.owner, self.other = make_student('student1'), make_student('student2')
+        self.staff = make_student('staff1', is_staff=True)
+        self.submission = Submission(student=self.owner, course=self.quiz.course, quiz=self.quiz)
+        self.submission.file = SimpleUploadedFile('answer.txt', self.CONTENT)
+        self.submission.save()
+        self.url = reverse('download_submission', args=[self.submission.id])
+
+    def test_permissions(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertIn('student1-CS-1-Q-1.txt', response['Content-Disposition'])
+        # Protected files are not reachable through the public media URL
+        self.assertEqual(self.client.get('/media/' + self.submission.file.name).status_code, 404)
+
+    def test_public_media_only_serves_editor_images(self):
+        # An upload stored before content addressing, outside blobs/
+        os.makedirs(os.path.join(self.tmp, 'CS-1'))
+        for name in ['CS-1/student1-CS-1-Q-1.txt', 'image.png']:
+            with open(os.path.join(self.tmp, name), 'wb') as f:
+                f.write(self.CONTENT)
+        request = RequestFactory().get('/')
+        self.assertEqual(views.serve_media(request, 'image.png').status_code, 200)
+        blob = self.submission.file.name
+        for path in [
+            blob, f'./{blob}', blob.replace('/', '//'), f'x/../{blob}', f'{blob.split("/")[0]}/./{blob.split("/", 1)[1]}',
+            'CS-1/student1-CS-1-Q-1.txt', 'CS-1/./student1-CS-1-Q-1.txt', 'CS-1//student1-CS-1-Q-1.txt', '../image.png',
+        ]:
+            with self.subTest(path=path), self.assertRaises(Http404):
+                views.serve_media(request, path)
+
+    def test_conditional_and_range_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.client.get(self.url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+        response = self.client.get(self.url, headers={'Range': 'bytes=4-7'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 4-7/{len(self.CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), b'4567')
+        response = self.client.get(self.url, headers={'Range': 'bytes=-3'})
+        self.assertEqual(b''.join(response.streaming_content), b'def')
+        self.assertEqual(self.client.get(self.url, headers={'Range': 'bytes=99-'}).status_code, 416)
+
+    def test_front_end_server_offload(self):
+        self.client.force_login(self.owner)
+        with self.settings(PROTECTED_MEDIA_SERVER='nginx'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.submission.file.name)
+        self.assertEqual(response.content, b'')
+        with self.settings(PROTECTED_MEDIA_SERVER='apache'):
+            response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].endswith(self.submission.file.name))
+
+
+class AsyncViewTests(TestCase):
+    CONTENT = b'%PDF-1.4 async body'
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            MEDIA_ROOT=self.tmp, CHUNKED_UPLOAD_DIR=f'{self.tmp}/parts', SUBMISSION_CHUNK_SIZE=8,
+            PROTECTED_MEDIA_SERVER='',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        caches['fragments'].clear()
+        self.student = make_student('student1', first_name='Ada')
+        self.quiz = make_quiz(make_course(1), 1)
+
+    def request(self, method, path, user=None, **kwargs):
+        request = getattr(AsyncRequestFactory(), method)(path, **kwargs)
+        request.user = user or self.student
+
+        async def auser():
+            return request.user
+        request.auser = auser
+        request.session = {}
+        request.device = SimpleLazyObject(lambda: get_device(request))
+        request._messages = default_storage(request)
+        return request
+
+    async def render(self, view, *args, **kwargs):
+        response = await view(self.request('get', '/'), *args, **kwargs)
+        return response.content.decode()
+
+    async def test_dashboard_and_rankings(self):
+        submission = await sync_to_async(make_submission)(self.student, self.quiz)
+        await sync_to_async(bulk_grade)(self.quiz, {submission.id: (6, None)})
+        self.assertIn('Welcome back, Ada!', await self.render(views.dashboard_async))
+        # Served from the fragment cache the second time
+        self.assertIn('Welcome back, Ada!', await self.render(views.dashboard_async))
+        self.assertIn('#1 &middot; 6 / 10 marks', await self.render(views.view_overall_rank_async))
+
+    async def test_download_streams_asynchronously(self):
+        submission = Submission(student=self.student, course=self.quiz.course, quiz=self.quiz)
+        submission.file = SimpleUploadedFile('answer.pdf', self.CONTENT)
+        await sync_to_async(submission.save)()
+        response = await views.download_submission_async(self.request('get', '/', headers={'Range': 'bytes=0-3'}), submission.id)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'%PDF')
+        response = await views.download_submission_async(self.request('get', '/'), submission.id)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.CONTENT)
+        other = await sync_to_async(make_student)('student2')
+        with self.assertRaises(Http404):
+            await views.download_submission_async(self.request('get', '/', user=other), submission.id)
+
+    async def test_chunked_upload(self):
+        session = await sync_to_async(start_upload)(self.student, self.quiz, 'answer.pdf', len(self.CONTENT))
+        for offset in range(0, len(self.CONTENT), 8):
+            chunk = self.CONTENT[offset:offset + 8]
+            request = self.request(
+                'put', '/', data=chunk, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+            )
+            response = await views.upload_chunk_async(request, session.id)
+            self.assertEqual(json.loads(response.content)['received'], offset + len(chunk))
+        response = await views.complete_chunked_upload_async(self.request('post', '/'), session.id)
+        self.assertEqual(response.status_code, 200)
+        submission = await Submission.objects.aget(student=self.student, quiz=self.quiz)
+        self.assertEqual(await sync_to_async(submission.file.read)(), self.CONTENT)
+
+
+class ConcurrentSubmissionTests(TransactionTestCase):
+    WRITERS = 8
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(MEDIA_ROOT=self.tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.quiz = make_quiz(make_course(1), 1)
+
+    def submit_in_parallel(self, students, attempts):
+        # Every writer starts at the same moment and submits `attempts` times
+        url = reverse('submit_quiz', args=[self.quiz.id])
+        barrier = threading.Barrier(len(students))
+        statuses = []
+        failures = []
+
+        def writer(index, student):
+            try:
+                client = Client()
+                client.force_login(student)
+                barrier.wait()
+                for attempt in range(attempts):
+                    upload = SimpleUploadedFile(f'{student.username}.txt', f'writer {index} attempt {attempt}'.encode())
+                    statuses.append(client.post(url, {'file': upload}).status_code)
+            except Exception as e:
+                failures.append(e)
+                barrier.abort()
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=[index, student]) for index, student in enumerate(students)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertEqual(statuses, [302] * len(students) * attempts)
+
+    def test_parallel_submit_quiz_writers(self):
+        # With WAL, busy_timeout and IMMEDIATE transactions no writer may
+        # fail with "database is locked"
+        self.submit_in_parallel([make_student(f'student{i}') for i in range(self.WRITERS)], attempts=2)
+        self.assertEqual(Submission.objects.filter(quiz=self.quiz).count(), self.WRITERS)
+
+    def test_parallel_resubmissions_from_one_student(self):
+        student = make_student('student1')
+        self.submit_in_parallel([student] * self.WRITERS, attempts=3)
+        submission = Submission.objects.get(student=student, quiz=self.quiz)
+        # Every replaced file was released, only the final one is left
+        self.assertEqual(list(StoredBlob.objects.values_list('name', 'ref_count')), [(submission.file.name, 1)])
+        stored = [name for _, _, names in os.walk(os.path.join(self.tmp, 'blobs')) for name in names]
+        self.assertEqual(stored, [os.path.basename(submission.file.name)])
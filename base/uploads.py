@@ -0,0 +1,176 @@
+import asyncio
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from .models import UploadSession
+
+# Accepted submission types and the leading bytes each one must start with.
+# Plain text types have no signature; they are rejected if they contain NUL bytes.
+SUBMISSION_EXTENSIONS = ['pdf', 'doc', 'docx', 'zip', 'txt', 'cpp', 'py']
+FILE_SIGNATURES = {
+    'pdf': [b'%PDF'],
+    'zip': [b'PK\x03\x04', b'PK\x05\x06'],
+    'docx': [b'PK\x03\x04'],
+    'doc': [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],
+}
+STALE_UPLOAD_AGE = timedelta(hours=24)
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class AssembledUpload(File):
+    # Exposes temporary_file_path() so FileSystemStorage moves the assembled
+    # file into MEDIA_ROOT instead of copying it through Python.
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def file_extension(filename):
+    return str(filename).split('.')[-1].lower()
+
+def check_signature(extension, head):
+    signatures = FILE_SIGNATURES.get(extension)
+    if signatures is None:
+        return b'\x00' not in head
+    return any(head.startswith(signature) for signature in signatures)
+
+def chunk_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id}.part')
+
+def start_upload(student, quiz, filename, size):
+    if quiz.due_date <= timezone.now():
+        raise UploadError('Quiz submission deadline has passed', status=403)
+    if file_extension(filename) not in SUBMISSION_EXTENSIONS or '.' not in str(filename):
+        raise UploadError('Invalid file type. Please upload a PDF, DOC, DOCX, ZIP, TXT, CPP or PY file.')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Missing file size')
+    if size <= 0 or size > settings.SUBMISSION_MAX_SIZE:
+        raise UploadError(f'File must be between 1 byte and {settings.SUBMISSION_MAX_SIZE // (1024 * 1024)} MB')
+
+    # Resume an unfinished upload of the same file instead of starting over
+    session = UploadSession.objects.filter(student=student, quiz=quiz, filename=filename, size=size).first()
+    if session is None or not os.path.exists(chunk_path(session)):
+        if session is not None:
+            session.delete()
+        session = UploadSession.objects.create(student=student, quiz=quiz, filename=filename, size=size)
+        os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+        open(chunk_path(session), 'wb').close()
+    return session
+
+def check_chunk(session, offset, length):
+    if session.quiz.due_date <= timezone.now():
+        raise UploadError('Quiz submission deadline has passed', status=403)
+    if offset != session.received:
+        raise UploadError('Offset does not match the uploaded size', status=409)
+    if length <= 0 or length > settings.SUBMISSION_CHUNK_SIZE:
+        raise UploadError(f'Chunks must be between 1 and {settings.SUBMISSION_CHUNK_SIZE} bytes')
+    if offset + length > session.size:
+        raise UploadError('Chunk exceeds the declared file size')
+
+def write_chunk(path, offset, stream, length):
+    # Returns the first bytes of the file when writing at offset 0, so the
+    # caller can check its signature
+    with open(path, 'r+b') as part:
+        part.seek(offset)
+        remaining = length
+        head = b''
+        while remaining:
+            block = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            if offset == 0 and len(head) < 512:
+                head += block[:512 - len(head)]
+            part.write(block)
+            remaining -= len(block)
+        part.truncate()
+    if remaining:
+        raise UploadError('Chunk ended early')
+    return head
+
+def append_chunk(session, offset, stream, length):
+    # Writes `length` bytes from `stream` at `offset`. The offset must match
+    # what the server already holds, so a client that lost its connection
+    # asks for the session status and resumes from `received`.
+    check_chunk(session, offset, length)
+    head = write_chunk(chunk_path(session), offset, stream, length)
+    if offset == 0 and not check_signature(file_extension(session.filename), head):
+        discard_upload(session)
+        raise UploadError('File content does not match its extension')
+
+    # Only advance if no concurrent request already did
+    updated = UploadSession.objects.filter(id=session.id, received=offset).update(
+        received=offset + length, updated=timezone.now(),
+    )
+    if not updated:
+        raise UploadError('Offset does not match the uploaded size', status=409)
+    session.received = offset + length
+    return session
+
+async def aappend_chunk(session, offset, stream, length):
+    # append_chunk() for async views: the file write runs in a worker thread
+    # and the session is updated with the async ORM. `session.quiz` must be
+    # loaded already.
+    check_chunk(session, offset, length)
+    head = await asyncio.to_thread(write_chunk, chunk_path(session), offset, stream, length)
+    if offset == 0 and not check_signature(file_extension(session.filename), head):
+        await adiscard_upload(session)
+        raise UploadError('File content does not match its extension')
+
+    updated = await UploadSession.objects.filter(id=session.id, received=offset).aupdate(
+        received=offset + length, updated=timezone.now(),
+    )
+    if not updated:
+        raise UploadError('Offset does not match the uploaded size', status=409)
+    session.received = offset + length
+    return session
+
+def finish_upload(session, save):
+    # Hands the assembled file to `save(file)`, which stores it on the
+    # submission; the temporary file is moved into place, not copied. The
+    # deadline may have passed since the last chunk arrived.
+    if session.quiz.due_date <= timezone.now():
+        raise UploadError('Quiz submission deadline has passed', status=403)
+    if session.received != session.size:
+        raise UploadError('Upload is not complete', status=409)
+    upload = AssembledUpload(chunk_path(session), session.filename)
+    try:
+        result = save(upload)
+    finally:
+        upload.close()
+    discard_upload(session)
+    return result
+
+def discard_upload(session):
+    try:
+        os.remove(chunk_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+async def adiscard_upload(session):
+    try:
+        await asyncio.to_thread(os.remove, chunk_path(session))
+    except FileNotFoundError:
+        pass
+    await session.adelete()
+
+def clear_stale_uploads(max_age=STALE_UPLOAD_AGE):
+    stale = UploadSession.objects.filter(updated__lt=timezone.now() - max_age)
+    count = 0
+    for session in stale:
+        discard_upload(session)
+        count += 1
+    return count
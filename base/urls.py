@@ -1,9 +1,14 @@
-from django.urls import path
-from . import views
+import re
+from django.urls import path, re_path
+from . import api, views
 from django.conf import settings
-from django.conf.urls.static import static
 from django.conf.urls import include
 
+
+def io_bound(sync_view, async_view):
+    # The async version is routed when serving over ASGI, see ASYNC_VIEWS
+    return async_view if settings.ASYNC_VIEWS else sync_view
+
 urlpatterns = [
     # ===============================
     # Authentication URLs
@@ -17,6 +22,7 @@ urlpatterns = [
     # User Management URLs
     # ===============================
     path('register_student/', views.register_student, name='register_student'),
+    path('bulk_register/', views.bulk_register_students, name='bulk_register_students'),
     path('registered_students/', views.registered_students, name='registered_students'),
     path('delete_student/<int:student_id>/', views.delete_student, name='delete_student'),
     path('delete_staff/<int:staff_id>/', views.delete_staff, name='delete_staff'),
@@ -27,7 +33,7 @@ urlpatterns = [
     # ===============================
     # Dashboard URL
     # ===============================
-    path('', views.dashboard, name='dashboard'),
+    path('', io_bound(views.dashboard, views.dashboard_async), name='dashboard'),
 
     # ===============================
     # Course Management URLs
@@ -42,6 +48,7 @@ urlpatterns = [
     # ===============================
     path('add_quiz/', views.add_quiz, name='add_quiz'),
     path('quizzes/<int:course_id>/', views.quizzes, name='quizzes'),
+    path('quiz_description/<int:quiz_id>/', views.quiz_description, name='quiz_description'),
     path('edit_quiz/<int:quiz_id>/', views.edit_quiz, name='edit_quiz'),
     path('delete_quiz/<int:quiz_id>/', views.delete_quiz, name='delete_quiz'),
 
@@ -49,9 +56,17 @@ urlpatterns = [
     # Submission Management URLs
     # ===============================
     path('submit_quiz/<int:quiz_id>/', views.submit_quiz, name='submit_quiz'),
+    path('submit_quiz/<int:quiz_id>/upload/', views.start_chunked_upload, name='start_chunked_upload'),
+    path('uploads/<uuid:upload_id>/', io_bound(views.upload_chunk, views.upload_chunk_async), name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', io_bound(views.complete_chunked_upload, views.complete_chunked_upload_async), name='complete_chunked_upload'),
+    path('download_submission/<int:submission_id>/', io_bound(views.download_submission, views.download_submission_async), name='download_submission'),
+    path('download_help_file/<int:quiz_id>/', io_bound(views.download_help_file, views.download_help_file_async), name='download_help_file'),
     path('view_submissions/<int:course_id>/', views.view_submissions, name='view_submissions'),
+    path('export_gradebook/<int:course_id>/', views.export_gradebook, name='export_gradebook'),
+    path('import_gradebook/<int:course_id>/', views.import_gradebook_view, name='import_gradebook'),
     path('view_quiz_submissions/<int:quiz_id>/', views.view_quiz_submissions, name='view_quiz_submissions'),
     path('grade_submission/<int:submission_id>/', views.grade_submission, name='grade_submission'),
+    path('bulk_grade/<int:quiz_id>/', views.bulk_grade_submissions, name='bulk_grade'),
     path('remarks/<int:submission_id>/', views.remarks, name='remarks'),
     path('view_remarks/<int:submission_id>/', views.view_remarks, name='view_remarks'),
 
@@ -60,14 +75,43 @@ urlpatterns = [
     # ===============================
     path('submit_complaint/', views.submit_complaint, name='submit_complaint'),
     path('view_complaints/', views.view_complaints, name='view_complaints'),
+    path('view_complaint/<int:complaint_id>/', views.view_complaint, name='view_complaint'),
+
+    # ===============================
+    # Search URL
+    # ===============================
+    path('search/', views.search, name='search'),
 
     # ===============================
     # Rankings URL
     # ===============================
-    path('view_overall_rank/', views.view_overall_rank, name='view_overall_rank'),
+    path('view_overall_rank/', io_bound(views.view_overall_rank, views.view_overall_rank_async), name='view_overall_rank'),
+
+    # ===============================
+    # Monitoring URL
+    # ===============================
+    path('metrics/', views.metrics_view, name='metrics'),
+
+    # ===============================
+    # API URLs
+    # ===============================
+    path('api/v1/courses/', api.courses, name='api_courses'),
+    path('api/v1/courses/<int:course_id>/quizzes/', api.quizzes, name='api_quizzes'),
+    path('api/v1/me/submissions/', api.submissions, name='api_submissions'),
+    path('api/v1/me/ranking/', api.ranking, name='api_ranking'),
 
     # ===============================
     # Third Party URLs
     # ===============================
     path("ckeditor5/", include('django_ckeditor_5.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
+
+if settings.DEBUG:
+    # ===============================
+    # Media URLs
+    # ===============================
+    # In production the web server serves the editor images in MEDIA_ROOT,
+    # as with static(); protected files go through the download views
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), views.serve_media, name='media'),
+    ]
\ No newline at end of file
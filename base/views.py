@@ -1,16 +1,45 @@
 from django.shortcuts import render
+from django.conf import settings as django_settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from .forms import RemarksForm, QuizAddingForm, StudentComplaintsForm
-from .models import Quiz, Submission, Courses, User, StudentProfile, StudentComplaints
+from .models import (
+    Quiz, Submission, Courses, User, StudentProfile, StudentComplaints, UploadSession, StoredBlob, SearchDocument,
+    student_directory_path,
+)
+from .caching import fragment_context, afragment_context, afragment_cached
+from .devices import recent_login_devices
+from .downloads import serve_file, aserve_file
+from .instrumentation import metrics
+from .search import get_search_page
+from .gradebook import gradebook_rows, import_gradebook
+from .notifications import announce_quiz, enqueue_grade_notifications
+from .registration import bulk_register, read_registration_csv
+from .services import (
+    get_student_stats, find_rankings_page, load_rankings_page, get_user_rank,
+    aget_student_stats, afind_rankings_page, aload_rankings_page, aget_user_rank,
+    get_quiz_roster_page, get_quiz_submission_counts, submission_listing, get_submission_page,
+    complaint_listing, get_complaint_page,
+    bulk_grade, save_submission,
+)
+from .uploads import (
+    SUBMISSION_EXTENSIONS, UploadError, file_extension, start_upload, append_chunk, aappend_chunk, finish_upload,
+)
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, aget_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 from django.contrib.auth.hashers import check_password
 from django.shortcuts import render
+from django.db import transaction
 from django.db.models import Sum, Count, Q
-import httpagentparser
+import os
+import posixpath
 
 # ===============================
 # Authentication Views
@@ -107,6 +136,7 @@ def settings(request):
     context = {
         'user': user,
         'profile': profile,
+        'login_devices': recent_login_devices(user),
     }
 
     return render(request, 'base/settings.html', context)
@@ -168,6 +198,20 @@ def register_student(request):
 
     return render(request, 'base/register_student.html')
 
+@staff_member_required(login_url='dashboard')
+def bulk_register_students(request):
+    if request.method == 'POST':
+        file = request.FILES.get('file')
+        if not file or not str(file.name).lower().endswith('.csv'):
+            messages.error(request, 'Please upload a CSV file')
+            return redirect('bulk_register_students')
+        # Hashed serially, see base.registration.hash_passwords
+        created, errors = bulk_register(read_registration_csv(file.file), workers=1)
+        if created:
+            messages.success(request, f'{created} user{"s" if created != 1 else ""} registered successfully')
+        return render(request, 'base/bulk_register.html', {'created': created, 'errors': errors})
+    return render(request, 'base/bulk_register.html')
+
 @staff_member_required(login_url='dashboard')
 def registered_students(request):
     students = User.objects.filter(is_staff=False)
@@ -270,49 +314,16 @@ def suspend_user(request, user_id):
 
 @login_required(login_url='login')
 def dashboard(request):
-    courses = Courses.objects.all()
-    quizzes = Quiz.objects.all()
-    submissions = Submission.objects.filter(student=request.user)
-    submission_counts = {course.id: submissions.filter(course=course).count() for course in courses}
-    marks_sums = {
-    course.id: submissions.filter(course=course, marks__isnull=False).aggregate(Sum('marks'))['marks__sum'] or 0
-        for course in courses
-    }
-    # Calculate totals for dashboard cards
-    total_submissions = sum(submission_counts.values())
-    total_marks = sum(marks_sums.values())
-
-    # New metrics for expanded dashboard
-    total_quizzes_available = quizzes.count()
-    pending_quizzes = total_quizzes_available - total_submissions
-
-    # Calculate average score (handle division by zero)
-    graded_submissions = submissions.filter(marks__isnull=False)
-    if graded_submissions.count() > 0:
-        average_score = graded_submissions.aggregate(avg=Sum('marks'))['avg'] / graded_submissions.count()
-        average_score = round(average_score, 2)
-    else:
-        average_score = 0
-
-    user_agent = request.META.get('HTTP_USER_AGENT')
-    user_ip = request.META.get('REMOTE_ADDR')
-    device_info = httpagentparser.detect(user_agent)
-    device_type = device_info.get("platform", {}).get("name", "Unknown Device")
+    # Only computed when the cached fragment has to be rendered again
+    stats = SimpleLazyObject(lambda: get_student_stats(request.user))
 
     context = {
-        'courses': courses,
-        'quizzes': quizzes,
-        'submissions': submissions,
-        'submission_counts': submission_counts,
-        'marks_sums': marks_sums,
-        'total_submissions': total_submissions,
-        'total_marks': total_marks,
-        'total_quizzes_available': total_quizzes_available,
-        'pending_quizzes': pending_quizzes,
-        'average_score': average_score,
-        'user_agent': user_agent,
-        'user_ip': user_ip,
-        'device_type': device_type
+        'stats': stats,
+        'user_agent': request.META.get('HTTP_USER_AGENT'),
+        'user_ip': request.META.get('REMOTE_ADDR'),
+        # Parsed once per session by base.middleware.DeviceMiddleware
+        'device': request.device,
+        **fragment_context('catalogue', f'user:{request.user.id}'),
     }
 
     return render(request, 'base/dashboard.html', context)
@@ -324,7 +335,7 @@ def dashboard(request):
 @login_required(login_url='login')
 def courses(request):
     courses = Courses.objects.all()
-    return render(request, 'base/courses.html', {'courses': courses})
+    return render(request, 'base/courses.html', {'courses': courses, **fragment_context('catalogue')})
 
 @staff_member_required(login_url='dashboard')
 def add_course(request):
@@ -369,11 +380,30 @@ def delete_course(request, course_id):
 @login_required(login_url='login')
 def quizzes(request, course_id):
     course = get_object_or_404(Courses, id=course_id)
-    quizzes = Quiz.objects.filter(course=course)
-    submissions = Submission.objects.filter(student=request.user)
-    submitted_quizzes = submissions.values_list('quiz_id', flat=True)
+    # Only the excerpts are shown; full descriptions load from quiz_description
+    quizzes = Quiz.objects.filter(course=course).defer('description', 'description_html')
+    # quiz id -> the user's submission, looked up per quiz with get_item
+    submissions = SimpleLazyObject(lambda: {
+        submission.quiz_id: submission
+        for submission in Submission.objects.filter(student=request.user, course=course).only('id', 'quiz_id')
+    })
     now = timezone.now()
-    return render(request, 'base/quizzes.html', {'quizzes': quizzes, 'course': course, 'submissions': submissions, 'submitted_quizzes': submitted_quizzes, 'now': now})
+    # The page changes when a deadline passes as well as on writes
+    closed = Quiz.objects.filter(course=course, due_date__lte=now).count()
+    context = {
+        'quizzes': quizzes,
+        'course': course,
+        'submissions': submissions,
+        'now': now,
+        'closed': closed,
+        **fragment_context(f'course:{course.id}', f'user:{request.user.id}'),
+    }
+    return render(request, 'base/quizzes.html', context)
+
+@login_required(login_url='login')
+def quiz_description(request, quiz_id):
+    quiz = get_object_or_404(Quiz.objects.only('description_html'), id=quiz_id)
+    return JsonResponse({'id': quiz.id, 'html': quiz.description_html})
 
 @staff_member_required(login_url='dashboard')
 def add_quiz(request):
@@ -382,7 +412,9 @@ def add_quiz(request):
     if request.method == 'POST':
         form = QuizAddingForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                quiz = form.save()
+                announce_quiz.enqueue(quiz_id=quiz.id)
             messages.success(request, 'Quiz added successfully')
             return redirect('quizzes', form.cleaned_data['course'].id)
     return render(request, 'base/add_quiz.html', {'courses': None, 'form': form})
@@ -395,7 +427,9 @@ def edit_quiz(request, quiz_id):
     if request.method == 'POST':
         form = QuizAddingForm(request.POST, request.FILES, instance=quiz)
         if form.is_valid():
-            form.save()
+            # A replaced help file is locked by the storage until the quiz is saved
+            with transaction.atomic():
+                form.save()
             messages.success(request, 'Quiz updated successfully')
             return redirect('quizzes', form.cleaned_data['course'].id)
     return render(request, 'base/edit_quiz.html', {'quiz': quiz, 'courses': courses, 'form': form})
@@ -422,37 +456,154 @@ def submit_quiz(request, quiz_id):
         return redirect('quizzes', quiz.course.id)
     if request.method == 'POST':
         file = request.FILES.get('file')
-        extention = str(file.name).split('.')[-1]
-        if file and extention.lower() in ['pdf', 'doc', 'docx', 'zip', 'txt', 'cpp', 'py']:
-            if Submission.objects.filter(student=student, quiz=quiz).exists():
-                # replace the file with the new one
-                submission = Submission.objects.get(student=student, quiz=quiz)
-                submission.file = file
-                submission.save()
-            else:
-                Submission.objects.create(student=student, course=quiz.course, quiz=quiz, file=file)
+        if file and file_extension(file.name) in SUBMISSION_EXTENSIONS:
+            save_submission(student, quiz, file)
             messages.success(request, 'Quiz submitted successfully')
             return redirect('quizzes', quiz.course.id)
         else:
             messages.error(request, 'Invalid file type. Please upload a PDF, DOC, DOCX, ZIP, or TXT file.')
             return redirect('submit_quiz', quiz.id)
-    return render(request, 'base/submit_quiz.html', {'quiz': quiz})
+    context = {
+        'quiz': quiz,
+        'chunk_size': django_settings.SUBMISSION_CHUNK_SIZE,
+        'max_size': django_settings.SUBMISSION_MAX_SIZE,
+    }
+    return render(request, 'base/submit_quiz.html', context)
+
+@login_required(login_url='login')
+def start_chunked_upload(request, quiz_id):
+    quiz = get_object_or_404(Quiz, id=quiz_id)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        session = start_upload(request.user, quiz, request.POST.get('filename', ''), request.POST.get('size'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({
+        'upload_id': str(session.id),
+        'received': session.received,
+        'chunk_size': django_settings.SUBMISSION_CHUNK_SIZE,
+    })
+
+@login_required(login_url='login')
+def upload_chunk(request, upload_id):
+    session = get_object_or_404(UploadSession.objects.select_related('quiz'), id=upload_id, student=request.user)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        try:
+            append_chunk(session, offset, request, length)
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'received': session.received}, status=e.status)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'GET or PUT required'}, status=405)
+    return JsonResponse({'upload_id': str(session.id), 'received': session.received, 'size': session.size})
+
+@login_required(login_url='login')
+def complete_chunked_upload(request, upload_id):
+    session = get_object_or_404(UploadSession.objects.select_related('quiz'), id=upload_id, student=request.user)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    quiz = session.quiz
+    try:
+        finish_upload(session, lambda file: save_submission(request.user, quiz, file))
+    except UploadError as e:
+        return JsonResponse({'error': str(e), 'received': session.received}, status=e.status)
+    messages.success(request, 'Quiz submitted successfully')
+    return JsonResponse({'redirect': reverse('quizzes', args=[quiz.course_id])})
+
+@login_required(login_url='login')
+def download_submission(request, submission_id):
+    submission = get_object_or_404(Submission.objects.select_related('student', 'course', 'quiz'), id=submission_id)
+    if not (request.user.is_staff or request.user.is_superuser or submission.student_id == request.user.id):
+        raise Http404('File not found')
+    if not submission.file:
+        raise Http404('File not found')
+    download_name = os.path.basename(student_directory_path(submission, submission.file.name))
+    return serve_file(request, submission.file.name, download_name)
+
+@login_required(login_url='login')
+def download_help_file(request, quiz_id):
+    quiz = get_object_or_404(Quiz, id=quiz_id)
+    if not quiz.help_file:
+        raise Http404('File not found')
+    download_name = f'{quiz.quiz_no}-help.{file_extension(quiz.help_file.name)}'
+    return serve_file(request, quiz.help_file.name, download_name)
+
+def serve_media(request, path):
+    # Public media in development: the rich-text editor saves its images at
+    # the top of MEDIA_ROOT. Submissions and help files live in directories
+    # (blobs/, or <course_no>/ for older uploads) and are only served by the
+    # permission-checked views above. The path is normalized first so that
+    # "a/./b", "a//b" or "x/../blobs/..." can't get around the checks.
+    name = posixpath.normpath(path.replace('\\', '/'))
+    if name.startswith(('.', '/')) or '/' in name or StoredBlob.objects.filter(name=name).exists():
+        raise Http404('File not found')
+    return serve_file(request, name, name, as_attachment=False)
 
 @staff_member_required(login_url='dashboard')
 def view_submissions(request, course_id):
     course = get_object_or_404(Courses, id=course_id)
-    submissions = Submission.objects.filter(course=course)
-    return render(request, 'base/submissions.html', {'submissions': submissions})
+    filters = {
+        'quiz_id': request.GET.get('quiz', ''),
+        'status': request.GET.get('status', ''),
+        'date_from': request.GET.get('from', ''),
+        'date_to': request.GET.get('to', ''),
+    }
+    if not filters['quiz_id'].isdigit():
+        filters['quiz_id'] = ''
+    submissions = submission_listing(course=course, **filters)
+    page = get_submission_page(submissions, after=request.GET.get('after'), before=request.GET.get('before'))
+    context = {
+        **page,
+        'course': course,
+        'quizzes': Quiz.objects.filter(course=course).only('quiz_title', 'quiz_no'),
+        'total_submissions': submissions.count(),
+        'filters': filters,
+    }
+    return render(request, 'base/submissions.html', context)
+
+@staff_member_required(login_url='dashboard')
+def export_gradebook(request, course_id):
+    course = get_object_or_404(Courses, id=course_id)
+    response = StreamingHttpResponse(gradebook_rows(course), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="gradebook-{course.course_no}.csv"'
+    return response
+
+@staff_member_required(login_url='dashboard')
+def import_gradebook_view(request, course_id):
+    course = get_object_or_404(Courses, id=course_id)
+    if request.method == 'POST':
+        file = request.FILES.get('file')
+        if not file or not str(file.name).lower().endswith('.csv'):
+            messages.error(request, 'Please upload a CSV file exported from the gradebook.')
+            return redirect('view_submissions', course.id)
+        updated, errors = import_gradebook(course, file)
+        messages.success(request, f'Gradebook imported: {updated} mark{"s" if updated != 1 else ""} updated')
+        for where, error in errors[:20]:
+            messages.error(request, f'{where}: {error}')
+        if len(errors) > 20:
+            messages.error(request, f'{len(errors) - 20} more problems not shown')
+    return redirect('view_submissions', course.id)
 
 @login_required(login_url='login')
 def view_quiz_submissions(request, quiz_id):
-    quiz = get_object_or_404(Quiz, id=quiz_id)
+    quiz = get_object_or_404(Quiz.objects.select_related('course'), id=quiz_id)
     if request.user.is_staff or request.user.is_superuser or quiz.due_date <= timezone.now():
-        users = User.objects.all()
-        for user in users:
-            submission = Submission.objects.filter(student=user, quiz=quiz).first()
-            user.submission = submission
-        return render(request, 'base/quiz_submissions.html', {'quiz': quiz, 'users': users})
+        status = request.GET.get('status')
+        sort = request.GET.get('sort')
+        users = get_quiz_roster_page(quiz, request.GET.get('page'), status=status, sort=sort)
+        context = {
+            'quiz': quiz,
+            'users': users,
+            'counts': get_quiz_submission_counts(quiz),
+            'status': status,
+            'sort': sort,
+        }
+        return render(request, 'base/quiz_submissions.html', context)
     else:
         return redirect('quizzes', quiz.course.id)
 
@@ -465,12 +616,48 @@ def grade_submission(request, submission_id):
             messages.error(request, 'Invalid marks. Please assign marks between 0 and 10.')
             return redirect('grade_submission', submission_id)
         else:
-            submission.marks = int(marks)
-            submission.save()
+            with transaction.atomic():
+                # Locked so that a concurrent grader's change is the one the
+                # leaderboard delta starts from, see base.signals
+                submission = Submission.objects.select_for_update().get(id=submission.id)
+                submission.marks = int(marks)
+                submission.save()
+                enqueue_grade_notifications([submission.id])
             messages.success(request, f'Marks assigned: {marks} to {submission.student.username}')
         return redirect('view_quiz_submissions', quiz_id=submission.quiz.id)
     return render(request, 'base/grade_submission.html', {'submission': submission})
 
+@staff_member_required(login_url='dashboard')
+def bulk_grade_submissions(request, quiz_id):
+    quiz = get_object_or_404(Quiz, id=quiz_id)
+    redirect_url = reverse('view_quiz_submissions', args=[quiz.id])
+    if request.GET:
+        redirect_url += '?' + request.GET.urlencode()
+    if request.method != 'POST':
+        return redirect(redirect_url)
+
+    # Rows with remarks but no marks are passed on too, so bulk_grade can
+    # report them as skipped
+    grades = {}
+    for key, value in request.POST.items():
+        field, _, submission_id = key.partition('_')
+        if field not in ('marks', 'remarks') or not submission_id.isdigit() or not value.strip():
+            continue
+        marks = request.POST.get(f'marks_{submission_id}', '').strip()
+        remarks = request.POST.get(f'remarks_{submission_id}', '').strip()
+        grades[int(submission_id)] = (marks or None, remarks or None)
+
+    if not grades:
+        messages.error(request, 'Please enter marks for at least one submission')
+        return redirect(redirect_url)
+
+    updated, errors = bulk_grade(quiz, grades)
+    if updated:
+        messages.success(request, f'Marks saved for {updated} submission{"s" if updated != 1 else ""}')
+    for student, error in errors:
+        messages.error(request, f'{student}: {error}')
+    return redirect(redirect_url)
+
 @staff_member_required(login_url='dashboard')
 def remarks(request, submission_id):
     form = RemarksForm()
@@ -512,8 +699,43 @@ def submit_complaint(request):
 
 @staff_member_required(login_url='dashboard')
 def view_complaints(request):
-    complaints = StudentComplaints.objects.all()
-    return render(request, 'base/view_complaints.html', {'complaints': complaints})
+    # Lists the stored previews only; the full text is on view_complaint
+    filters = {
+        'student': request.GET.get('student', '').strip(),
+        'date_from': request.GET.get('from', ''),
+        'date_to': request.GET.get('to', ''),
+    }
+    complaints = complaint_listing(**filters)
+    page = get_complaint_page(complaints, after=request.GET.get('after'), before=request.GET.get('before'))
+    context = {
+        **page,
+        'total_complaints': complaints.count(),
+        'filters': filters,
+    }
+    return render(request, 'base/view_complaints.html', context)
+
+@staff_member_required(login_url='dashboard')
+def view_complaint(request, complaint_id):
+    complaint = get_object_or_404(StudentComplaints.objects.select_related('student'), id=complaint_id)
+    return render(request, 'base/view_complaint.html', {'complaint': complaint})
+
+# ===============================
+# Search Views
+# ===============================
+
+@staff_member_required(login_url='dashboard')
+def search(request):
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+    if kind not in dict(SearchDocument.KIND_CHOICES):
+        kind = ''
+    context = {
+        'query': query,
+        'kind': kind,
+        'kinds': SearchDocument.KIND_CHOICES,
+        'results': get_search_page(query, request.GET.get('page'), kinds=[kind] if kind else None) if query else None,
+    }
+    return render(request, 'base/search.html', context)
 
 # ===============================
 # Rankings Views
@@ -521,21 +743,127 @@ def view_complaints(request):
 
 @login_required(login_url='login')
 def view_overall_rank(request):
-    total_possible_marks = Quiz.objects.count() * 10
-    user_marks = User.objects.annotate(
-        total_marks=Sum('submission__marks', filter=Q(submission__marks__isnull=False)),
-        num_submissions=Count('submission', filter=Q(submission__marks__isnull=False))
-    ).order_by('-total_marks')
-    rankings = [{
-        'student__username': user.username,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'total_marks': user.total_marks or 0,
+    # The fragment is keyed on the resolved page number, not the raw query
+    # string, so made-up page values can't fill the cache
+    page = find_rankings_page(request.GET.get('page'))
+    context = {
+        'page': page.number,
+        'rankings': SimpleLazyObject(lambda: load_rankings_page(page)),
+        'current_user_rank': SimpleLazyObject(lambda: get_user_rank(request.user)),
+        'total_possible_marks': SimpleLazyObject(lambda: Quiz.objects.count() * 10),
+        **fragment_context('catalogue', 'rankings'),
+    }
+    return render(request, 'base/overall_rank.html', context)
+
+# ===============================
+# Monitoring Views
+# ===============================
+
+def metrics_view(request):
+    # Prometheus scrape target: staff sessions, or `Authorization: Bearer
+    # <METRICS_TOKEN>` for the scraper
+    token = django_settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (token and constant_time_compare(authorization, f'Bearer {token}')):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ===============================
+# Async Views (ASGI)
+# ===============================
+# Async versions of the I/O-bound views, routed instead of the sync ones when
+# ASYNC_VIEWS is set (the default in studybud/asgi.py). Queries use the async
+# ORM; templates touch request.user and lazy relations, so they are rendered
+# in the sync thread.
+
+@login_required(login_url='login')
+async def dashboard_async(request):
+    user = await request.auser()
+    fragment = await afragment_context('catalogue', f'user:{user.id}')
+    if await afragment_cached('dashboard', user.id, fragment['fragment_version']):
+        stats = SimpleLazyObject(lambda: get_student_stats(user))
+    else:
+        stats = await aget_student_stats(user)
+
+    context = {
+        'stats': stats,
+        'user_agent': request.META.get('HTTP_USER_AGENT'),
+        'user_ip': request.META.get('REMOTE_ADDR'),
+        'device': request.device,
+        **fragment,
+    }
+    return await sync_to_async(render)(request, 'base/dashboard.html', context)
+
+@login_required(login_url='login')
+async def upload_chunk_async(request, upload_id):
+    user = await request.auser()
+    session = await aget_object_or_404(UploadSession.objects.select_related('quiz'), id=upload_id, student=user)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        try:
+            await aappend_chunk(session, offset, request, length)
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'received': session.received}, status=e.status)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'GET or PUT required'}, status=405)
+    return JsonResponse({'upload_id': str(session.id), 'received': session.received, 'size': session.size})
+
+@login_required(login_url='login')
+async def complete_chunked_upload_async(request, upload_id):
+    user = await request.auser()
+    session = await aget_object_or_404(UploadSession.objects.select_related('quiz'), id=upload_id, student=user)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    quiz = session.quiz
+    try:
+        # Storing the file hashes it and writes several rows in one transaction
+        await sync_to_async(finish_upload)(session, lambda file: save_submission(user, quiz, file))
+    except UploadError as e:
+        return JsonResponse({'error': str(e), 'received': session.received}, status=e.status)
+    messages.success(request, 'Quiz submitted successfully')
+    return JsonResponse({'redirect': reverse('quizzes', args=[quiz.course_id])})
+
+@login_required(login_url='login')
+async def download_submission_async(request, submission_id):
+    user = await request.auser()
+    submission = await aget_object_or_404(Submission.objects.select_related('student', 'course', 'quiz'), id=submission_id)
+    if not (user.is_staff or user.is_superuser or submission.student_id == user.id):
+        raise Http404('File not found')
+    if not submission.file:
+        raise Http404('File not found')
+    download_name = os.path.basename(student_directory_path(submission, submission.file.name))
+    return aserve_file(request, submission.file.name, download_name)
+
+@login_required(login_url='login')
+async def download_help_file_async(request, quiz_id):
+    quiz = await aget_object_or_404(Quiz, id=quiz_id)
+    if not quiz.help_file:
+        raise Http404('File not found')
+    download_name = f'{quiz.quiz_no}-help.{file_extension(quiz.help_file.name)}'
+    return aserve_file(request, quiz.help_file.name, download_name)
+
+@login_required(login_url='login')
+async def view_overall_rank_async(request):
+    user = await request.auser()
+    page = await afind_rankings_page(request.GET.get('page'))
+    fragment = await afragment_context('catalogue', 'rankings')
+    if await afragment_cached('overall_rank', user.id, page.number, fragment['fragment_version']):
+        rankings = SimpleLazyObject(lambda: load_rankings_page(page))
+        current_user_rank = SimpleLazyObject(lambda: get_user_rank(user))
+        total_possible_marks = SimpleLazyObject(lambda: Quiz.objects.count() * 10)
+    else:
+        rankings = await aload_rankings_page(page)
+        current_user_rank = await aget_user_rank(user)
+        total_possible_marks = await Quiz.objects.acount() * 10
+    context = {
+        'page': page.number,
+        'rankings': rankings,
+        'current_user_rank': current_user_rank,
         'total_possible_marks': total_possible_marks,
-        'student__id': user.id
-    } for user in user_marks]
-    
-    for idx, user in enumerate(rankings):
-        user['rank'] = idx + 1
-    current_user_rank = next((item for item in rankings if item['student__id'] == request.user.id), None)
-    return render(request, 'base/overall_rank.html', {'rankings': rankings, 'current_user_rank': current_user_rank})
\ No newline at end of file
+        **fragment,
+    }
+    return await sync_to_async(render)(request, 'base/overall_rank.html', context)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'studybud.settings')
+# Serve the I/O-bound views asynchronously, see ASYNC_VIEWS in settings.py
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
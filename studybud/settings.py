@@ -44,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'base.middleware.DeviceMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,10 +59,17 @@ ROOT_URLCONF = 'studybud.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render times for base.instrumentation
+        'BACKEND': 'base.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are parsed once per process instead of on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -71,18 +80,134 @@ TEMPLATES = [
     },
 ]
 
+# Request instrumentation (base.instrumentation)
+# Send timings in a Server-Timing header, readable in the browser's dev tools
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+# Bearer token for /metrics/ scrapes; staff can always read it when logged in
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 WSGI_APPLICATION = 'studybud.wsgi.application'
+ASGI_APPLICATION = 'studybud.asgi.application'
+
+# Route the I/O-bound views (downloads, chunked uploads, dashboard, rankings)
+# to their async versions. studybud/asgi.py turns this on; under WSGI every
+# async view would need its own event loop, so it stays off there.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_ENGINE selects the profile:
+#   sqlite    small installs. WAL lets readers run alongside the single
+#             writer, writers queue for up to DB_BUSY_TIMEOUT seconds instead
+#             of failing with "database is locked", and IMMEDIATE
+#             transactions take the write lock up front so they can wait for
+#             it rather than fail when a read lock cannot be upgraded.
+#   postgres  production. Needs psycopg; DB_POOL uses psycopg's connection
+#             pool (psycopg[pool]), otherwise connections are kept open for
+#             DB_CONN_MAX_AGE seconds.
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = config('DB_POOL', default=False, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='studybud'),
+            'USER': config('DB_USER', default='studybud'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Pooled connections are returned to the pool after each request
+            'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+                    'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3'),
+            'OPTIONS': {
+                'timeout': config('DB_BUSY_TIMEOUT', default=20, cast=int),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                ),
+            },
+            # Tests run against a file too, so they see the same locking
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Both aliases are configured from the environment, CACHE_* for 'default'
+# (sessions and general use) and FRAGMENT_CACHE_* for the rendered page
+# fragments of base.caching. Backends:
+#   locmem     per process, evicts least recently used entries past
+#              MAX_ENTRIES. The default and the stand-in for tests and
+#              development; with several worker processes, writes in one
+#              are not seen by the others.
+#   file       shared by every process on the host (LOCATION is a directory)
+#   memcached  LOCATION is host:port, needs the pymemcache package
+#   redis      LOCATION is a redis:// URL, needs the redis package; set
+#              maxmemory-policy allkeys-lru on the server
+#   dummy      caches nothing
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+def cache_from_env(prefix, alias, redis_db, timeout):
+    backend = config(f'{prefix}_BACKEND', default='locmem')
+    location = config(f'{prefix}_LOCATION', default={
+        'locmem': alias,
+        'file': os.path.join(BASE_DIR, 'tmp', 'cache', alias),
+        'memcached': '127.0.0.1:11211',
+        'redis': f'redis://127.0.0.1:6379/{redis_db}',
+        'dummy': '',
+    }[backend])
+    options = {}
+    if backend in ('locmem', 'file'):
+        options['MAX_ENTRIES'] = config(f'{prefix}_MAX_ENTRIES', default=5000, cast=int)
+    return {
+        'BACKEND': CACHE_BACKENDS[backend],
+        'LOCATION': location,
+        'TIMEOUT': config(f'{prefix}_TIMEOUT', default=timeout, cast=int),
+        'KEY_PREFIX': alias,
+        'OPTIONS': options,
+    }
+
+CACHES = {
+    'default': cache_from_env('CACHE', 'default', redis_db=0, timeout=300),
+    'fragments': cache_from_env('FRAGMENT_CACHE', 'fragments', redis_db=1, timeout=600),
 }
+FRAGMENT_CACHE_TIMEOUT = CACHES['fragments']['TIMEOUT']
+
+# Sessions are read from the cache and written through to the database, so
+# an authenticated request no longer queries django_session. With more than
+# one worker process, use a shared CACHE_BACKEND so a logout is seen by all.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
 
 
 # Password validation
@@ -219,3 +344,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Submissions and help files are served by base.views after a permission
+# check. Set to 'nginx' (X-Accel-Redirect) or 'apache'/'lighttpd' (X-Sendfile)
+# to let the front-end server send the bytes; leave empty to stream from Python.
+PROTECTED_MEDIA_SERVER = config('PROTECTED_MEDIA_SERVER', default='')
+# nginx `internal` location that aliases MEDIA_ROOT
+PROTECTED_MEDIA_INTERNAL_URL = config('PROTECTED_MEDIA_INTERNAL_URL', default='/protected-media/')
+
+# Quiz submission uploads
+SUBMISSION_MAX_SIZE = config('SUBMISSION_MAX_SIZE', default=50 * 1024 * 1024, cast=int)
+SUBMISSION_CHUNK_SIZE = config('SUBMISSION_CHUNK_SIZE', default=1024 * 1024, cast=int)
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, config('CHUNKED_UPLOAD_DIR', default='tmp/uploads'))
+
+# Email, sent by the job worker (base.notifications). The console backend
+# prints messages instead of sending them.
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
+
+# Background jobs (base.jobs), run by `manage.py run_jobs`
+# Run jobs in the web process after commit instead, when no worker is running
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=False, cast=bool)
+# Seconds before the first retry; doubles with every further attempt
+JOBS_RETRY_DELAY = config('JOBS_RETRY_DELAY', default=30, cast=int)
+# Seconds a running job may go without finishing before it is requeued
+JOBS_TIMEOUT = config('JOBS_TIMEOUT', default=600, cast=int)
+# Days finished jobs are kept in the status table
+JOBS_KEEP_DAYS = config('JOBS_KEEP_DAYS', default=7, cast=int)